@@ -1,23 +1,41 @@
 import json
-import time
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from loguru import logger
 import re
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import image_manifest, catalog_db, shopify, keyed_cache
+from shared.browser_pool import BrowserPool, HostRateLimiter
+from shared.delta import FingerprintStore
+from shared.catalog import open_catalog
+from shared.browser import wait_for_page
 
 # Configure loguru
 logger.add("away_travel.log", rotation="1 day", retention="7 days", level="INFO")
 
 COLLECTION_URL = "https://www.awaytravel.com/collections/carry-on-luggage"
+HOST = "www.awaytravel.com"
+COLLECTION_HANDLE = "carry-on-luggage"
 DATA_FOLDER = "AwayTravel_Data"
-CACHE_DIR = "AwayTravel_Cache"
+CACHE_JSON = f"{DATA_FOLDER}/variant_cache.json"
 OUTPUT_JSON   = "urls.json"
-SCROLL_PAUSE  = 1             # seconds between scroll checks
-PAGE_LOAD_WAIT = 2          # seconds to wait for page load
+IMAGE_URLS_JSON = f"{DATA_FOLDER}/image_urls.json"
+SCROLL_QUIET_MS = 500        # no new products and no requests in flight this long after a scroll means the list is fully loaded
+SCROLL_MAX_WAIT_MS = 10000   # longest wait after one scroll, whatever requests are still open
+SCROLL_CEILING = 50          # most scroll rounds before giving up
+WORKERS = 3                 # browsers fetching product pages in parallel
+REQUESTS_PER_SECOND = 0.5   # awaytravel.com budget shared by all browsers
+TTL_HOURS = 24 * 7          # incremental runs refetch variants older than this
+CACHE_TTL_HOURS = 24 * 7    # cached variants older than this are fetched again
+CACHE_MAX_ENTRIES = 5000    # least recently used variants are evicted past this
+CSV_HEADERS = ["Brand", "Product Name", "Color", "Dimensions", "Weight"]
+# the size accordion paragraph with the dimensions and weight
+SIZE_ATTRIBUTES_XPATH = "//below-the-fold-listener//section//div//div[3]//div//div//div//p"
 
 def load_cached_urls():
     try:
@@ -29,6 +47,93 @@ def load_cached_urls():
         logger.warning("No cached URLs found")
         return None
 
+# scrolls to the bottom and resolves as soon as more variant-pickers than arguments[0] are on the page, or
+# with the unchanged count once no fetch/xhr is in flight and nothing has changed for arguments[1] ms.
+# arguments[2] ms caps the wait, for pages that keep a request open (analytics, long polling)
+WAIT_FOR_PRODUCTS_SCRIPT = """
+const previous = arguments[0], quietMs = arguments[1], maxWaitMs = arguments[2], done = arguments[arguments.length - 1];
+const count = () => document.querySelectorAll("variant-picker").length;
+if (count() > previous) {
+    done(count());
+    return;
+}
+// counts in-flight requests, installed once per page load
+if (!window.__scraperNetwork) {
+    const network = window.__scraperNetwork = {pending: 0, lastActivity: Date.now()};
+    const start = () => { network.pending++; network.lastActivity = Date.now(); };
+    const end = () => { network.pending--; network.lastActivity = Date.now(); };
+    const fetch = window.fetch;
+    window.fetch = function () {
+        start();
+        return fetch.apply(this, arguments).finally(end);
+    };
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        start();
+        this.addEventListener("loadend", end, {once: true});
+        return send.apply(this, arguments);
+    };
+}
+const network = window.__scraperNetwork;
+const started = Date.now();
+let lastChange = started;
+let poll;
+const finish = () => {
+    observer.disconnect();
+    clearInterval(poll);
+    done(count());
+};
+const observer = new MutationObserver(() => {
+    lastChange = Date.now();
+    if (count() > previous) finish();
+});
+poll = setInterval(() => {
+    const now = Date.now();
+    const idle = network.pending === 0 && now - Math.max(lastChange, network.lastActivity) >= quietMs;
+    if (idle || now - started >= maxWaitMs) finish();
+}, 50);
+observer.observe(document.body, {childList: true, subtree: true});
+window.scrollTo(0, document.body.scrollHeight);
+"""
+
+# product type and variant urls of every variant-picker not collected yet, marking them as collected
+COLLECT_VARIANTS_SCRIPT = """
+const products = [];
+for (const picker of document.querySelectorAll("variant-picker:not([data-scraper-collected])")) {
+    picker.setAttribute("data-scraper-collected", "");
+    const main = picker.closest("main-product");
+    const link = main && main.querySelector("a.h6");
+    products.push({
+        productType: link ? link.innerText.trim() : null,
+        urls: Array.from(picker.querySelectorAll('swiper-slide input[type="radio"][data-product-url]'), input => input.getAttribute("data-product-url")),
+    });
+}
+return products;
+"""
+
+# returns how many pickers had to be skipped
+def collect_new_variants(driver, all_variants):
+    skipped = 0
+    for product in driver.execute_script(COLLECT_VARIANTS_SCRIPT):
+        # Get the product type from the parent main-product element
+        product_type = product["productType"]
+        if not product_type:
+            logger.error("Could not find product type for a variant picker")
+            skipped += 1
+            continue
+
+        # Extract URLs for this product type
+        variant_urls = {
+            "https://www.awaytravel.com" + url if url.startswith("/") else url
+            for url in product["urls"]
+        }
+
+        if variant_urls:
+            all_variants[product_type] = list(variant_urls)
+            logger.info(f"Found {len(variant_urls)} variants for {product_type}")
+    return skipped
+
+# returns ({product type: variant urls}, True if the whole collection was listed). a partial list isn't cached
 def collect_product_urls():
     logger.info("Starting URL collection process")
     driver = uc.Chrome(headless=False, use_subprocess=False)  # Set to False for headed mode
@@ -37,50 +142,29 @@ def collect_product_urls():
         logger.info(f"Navigating to {COLLECTION_URL}")
         driver.get(COLLECTION_URL)
 
-        # Scroll until no new content loads
+        # Scroll until the product count stops growing, collecting each batch of variants as it appears
         logger.info("Scrolling to load all products")
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        while True:
-            driver.find_element(By.TAG_NAME, "body").send_keys(Keys.END)
-            time.sleep(SCROLL_PAUSE)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:   # reached the bottom
-                break
-            last_height = new_height
-
-        # Find all variant pickers and their color variants
-        logger.info("Collecting variant URLs")
-        variant_pickers = driver.find_elements(By.CSS_SELECTOR, 'variant-picker')
-        
+        driver.set_script_timeout(SCROLL_MAX_WAIT_MS / 1000 + 10)
         all_variants = {}
-        for picker in variant_pickers:
-            # Get the product type from the parent main-product element
-            try:
-                product_type = picker.find_element(
-                    By.XPATH,
-                    './ancestor::main-product//a[contains(@class, "h6")]'
-                ).text.strip()
-            except Exception as e:
-                logger.error(f"Could not find product type for a variant picker: {str(e)}")
-                continue
+        count = 0
+        skipped = 0
+        complete = True
+        for _ in range(SCROLL_CEILING):
+            skipped += collect_new_variants(driver, all_variants)
+            new_count = driver.execute_async_script(WAIT_FOR_PRODUCTS_SCRIPT, count, SCROLL_QUIET_MS, SCROLL_MAX_WAIT_MS)
+            if new_count == count:   # nothing appended within the quiet window, reached the bottom
+                break
+            count = new_count
+        else:
+            logger.warning(f"Stopped scrolling after {SCROLL_CEILING} rounds with {count} products loaded")
+            complete = False
+        skipped += collect_new_variants(driver, all_variants)
+        if skipped:
+            complete = False
 
-            # Find all radio inputs within this variant picker
-            radio_inputs = picker.find_elements(
-                By.CSS_SELECTOR,
-                'swiper-slide input[type="radio"][data-product-url]'
-            )
-            
-            # Extract URLs for this product type
-            variant_urls = {
-                "https://www.awaytravel.com" + input.get_attribute("data-product-url")
-                if input.get_attribute("data-product-url").startswith("/")
-                else input.get_attribute("data-product-url")
-                for input in radio_inputs
-            }
-            
-            if variant_urls:
-                all_variants[product_type] = list(variant_urls)
-                logger.info(f"Found {len(variant_urls)} variants for {product_type}")
+        if not complete:
+            logger.warning(f"The collection may be incomplete, not saving it to {OUTPUT_JSON}")
+            return all_variants, False
 
         # Persist to JSON
         logger.info(f"Saving variants for {len(all_variants)} products to {OUTPUT_JSON}")
@@ -88,12 +172,30 @@ def collect_product_urls():
             json.dump(all_variants, f, indent=2)
 
         logger.success(f"Saved variants for {len(all_variants)} products to {OUTPUT_JSON}")
-        return all_variants
+        return all_variants, True
 
     finally:
         logger.info("Closing browser session")
         driver.quit()
 
+# BULK MODE: the collection's products.json has every product, color and image in a few requests.
+# away lists each color as its own shopify product titled "<product name> in <color>".
+# returns ({product name: {url: color}}, {url: image urls})
+def collect_products_from_json(rate_limiter=None):
+    products = {}
+    images = {}
+    for product in shopify.collection_products(HOST, COLLECTION_HANDLE, rate_limiter):
+        colors = shopify.color_variants(product)
+        for color, variants in colors.items():
+            product_name = product["title"]
+            if color != "DEFAULT" and product_name.endswith(f" in {color}"):
+                product_name = product_name[:-len(f" in {color}")]
+            url = shopify.product_url(HOST, product, variants[0] if len(colors) > 1 else None)
+            products.setdefault(product_name, {})[url] = color
+            images[url] = [image_url.split("?")[0] for image_url in shopify.variant_images(product, variants)]
+    logger.info(f"Found {sum(len(colors) for colors in products.values())} variants of {len(products)} products")
+    return products, images
+
 def get_image_urls(driver):
     # Find the swiper container
     swiper_container = driver.find_element(By.XPATH, "(//swiper-container)[2]")
@@ -117,77 +219,61 @@ def get_image_urls(driver):
     
     return image_urls
 
-def get_product_data(url, driver, image_url_json, use_cache=False):
+# the size accordion sits below the fold and can render after the document has loaded
+def wait_for_product_page(driver):
+    wait_for_page(driver, "ready_state")
+    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, SIZE_ATTRIBUTES_XPATH)))
+
+# dimensions and weight from the size accordion of a loaded product page
+def get_size_attributes(driver):
+    size_attributes = driver.find_element(By.XPATH, SIZE_ATTRIBUTES_XPATH).get_attribute("innerHTML")
+    size_attributes = re.split(r'<br>|</strong>', size_attributes)
+    return size_attributes[1], size_attributes[5]
+
+# bulk mode: every color of a product shares its size accordion, so one page per product is enough
+def get_product_dimensions(url, driver):
+    logger.info(f"Getting dimensions from {url.split('/')[-1]}")
+    driver.get(url)
+    wait_for_product_page(driver)
+    return get_size_attributes(driver)
+
+def get_product_data(url, driver, image_urls_manifest, cache):
     url_brief = url.split("/")[-1]
-    logger.info(f"Getting product data for {url_brief}")
-    # the url brief is the last part of the url after the last /
-    cache_file = f"{CACHE_DIR}/{url_brief}.json"
-    if use_cache:
-        # check if cache file exists
-        logger.info(f"Checking for cache file for {url_brief}")
-        if os.path.exists(cache_file):
-            logger.info(f"Cache file found for {url_brief}")
-            with open(cache_file, "r", encoding="utf-8") as f:
-                json_data = json.load(f)
-                # Get image URLs from the image_url_json if available
-                return json_data["product_name"], json_data["color"], json_data["dimensions"], json_data["weight"]
-    
     # fetching product data
     logger.info(f"Fetching product data for {url_brief}")
     driver.get(url)
-    time.sleep(PAGE_LOAD_WAIT)
-
-    # wait for body to load
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+    wait_for_product_page(driver)
 
     # get color
     color = driver.find_element(By.XPATH, '//span[@data-selected-value]').text.strip()
     product_name = driver.find_element(By.XPATH, '//main-product[1]//section//div//h1').text.strip()
     
-    size_attributes = driver.find_element(By.XPATH, "//below-the-fold-listener//section//div//div[3]//div//div//div//p").get_attribute("innerHTML")
-    size_attributes = re.split(r'<br>|</strong>', size_attributes)
-    dimensions = size_attributes[1]
-    weight = size_attributes[5]
-
-    # save to cache
-    with open(cache_file, "w", encoding="utf-8") as f:
-        json.dump({"product_name": product_name, "color": color, "dimensions": dimensions, "weight": weight}, f)
+    dimensions, weight = get_size_attributes(driver)
 
     image_urls = get_image_urls(driver)
-    # Initialize the dictionary for this product if it doesn't exist
-    if product_name not in image_url_json:
-        image_url_json[product_name] = {}
-    image_url_json[product_name][color] = image_urls
-    # Save image URLs after each product
-    with open(f"{DATA_FOLDER}/image_urls.json", 'w', encoding="utf-8") as f:
-        json.dump(image_url_json, f, indent=2)
+    # everything a later run needs to skip the browser for this variant
+    record = {"product_name": product_name, "color": color, "dimensions": dimensions, "weight": weight, "image_urls": image_urls}
+    cache.put(url, record)
+    # buffered append, folded into image_urls.json when the run finishes
+    image_urls_manifest.add((product_name, color), image_urls, replace=True)
     logger.info(f"Saved data for {product_name}")
 
-    return product_name, color, dimensions, weight
-
-# create a csv file with headers then return the path
-def create_csv():
-    if not os.path.exists(DATA_FOLDER):
-        os.makedirs(DATA_FOLDER)
-
-    base_csv_path = os.path.join(DATA_FOLDER, 'awaytravel_data.csv')
-    csv_path = f"{base_csv_path}"
-    counter = 1
-    while os.path.exists(csv_path):
-        csv_path = os.path.join(DATA_FOLDER, f'awaytravel_data({counter}).csv')
-        counter += 1
-    
-    with open(csv_path, 'w', encoding="utf-8") as f:
-        f.write("Brand, Product Name,Color,Dimensions,Weight\n")
-    return csv_path    
+    return record
 
 if __name__ == "__main__":
     logger.info("Starting Away Travel scraper")
     
+    rate_limiter = HostRateLimiter(REQUESTS_PER_SECOND)
+    bulk = input("Would you like to use bulk mode (products.json, one browser page per product)? (y/n): ").strip() == 'y'
     # Check if we have cached URLs
-    cached_urls = load_cached_urls()
+    cached_urls = None if bulk else load_cached_urls()
     all_variants = []
-    if cached_urls:
+    # only a complete listing can tell which variants were removed from the site
+    discovery_complete = True
+    if bulk:
+        bulk_products, bulk_images = collect_products_from_json(rate_limiter)
+        all_variants = {product_name: list(colors) for product_name, colors in bulk_products.items()}
+    elif cached_urls:
         # Ask user if they want to use cached URLs or fetch new ones
         while True:
             choice = input("Would you like to:\n1. Use cached product URLs\n2. Fetch new product URLs\nEnter 1 or 2: ").strip()
@@ -200,36 +286,84 @@ if __name__ == "__main__":
             all_variants = cached_urls
         else:
             logger.info("Fetching new URLs")
-            all_variants = collect_product_urls()
+            all_variants, discovery_complete = collect_product_urls()
     else:
         logger.info("No cached URLs found. Fetching new URLs...")
-        all_variants = collect_product_urls()
+        all_variants, discovery_complete = collect_product_urls()
 
-    use_product_caches = input("Would you like to use product caches when possible? (y/n): ").strip() == 'y'
+    incremental = input("Would you like to run incrementally (only refetch new or stale variants)? (y/n): ").strip() == 'y'
+    # an incremental run decides freshness itself, so it never reads the variant cache
+    use_product_caches = not incremental and input("Would you like to use product caches when possible? (y/n): ").strip() == 'y'
+    fingerprints = FingerprintStore(DATA_FOLDER, TTL_HOURS) if incremental else None
 
-    # create cache dir if it doesn't exist
-    if not os.path.exists(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
-
-    driver = uc.Chrome(headless=False, use_subprocess=False)  # Set to False for headed mode
+    cache = keyed_cache.for_path(CACHE_JSON, CACHE_TTL_HOURS, CACHE_MAX_ENTRIES)
+    pool = BrowserPool(WORKERS, rate_limiter)
 
-    csv_path = create_csv()
-    image_url_json = {}
+    # typed parquet catalog plus a quoted csv view, so names with commas no longer break the file
+    catalog = open_catalog(DATA_FOLDER, "awaytravel_data", store=catalog_db.for_path(), retailer="Away Travel")
+    image_urls_manifest = image_manifest.for_path(IMAGE_URLS_JSON)
 
-    csv = open(csv_path, 'a', encoding="utf-8")
-    if os.path.exists(f"{DATA_FOLDER}/image_urls.json"):
-        image_url_json = json.load(open(f"{DATA_FOLDER}/image_urls.json", 'r', encoding="utf-8"))
-    else:
-        image_url_json = {}
+    # record is a variant cache entry, it also goes to the catalog database as the variant's raw payload
+    def write_row(url, record):
+        row = ["Away Travel", record["product_name"], record["color"], record["dimensions"], record["weight"]]
+        catalog.write(row, key=url, url=url, image_urls=record["image_urls"], raw=record)
+        if fingerprints is not None:
+            fingerprints.update(url, row)
 
-    for product_type, urls in all_variants.items():
+    # writes every cached variant straight to the catalog and returns the urls that still need the browser
+    def write_cached(urls):
+        misses = []
         for url in urls:
-            product_name, color, dimensions, weight = get_product_data(url, driver, image_url_json, use_product_caches)
-            csv.write(f"Away Travel,{product_name},{color},{dimensions},{weight}\n")
-            csv.flush()  # Force write to disk
+            cached = cache.get(url)
+            if cached is None:
+                misses.append(url)
+                continue
+            image_urls_manifest.add((cached["product_name"], cached["color"]), cached["image_urls"], replace=True)
+            write_row(url, cached)
+        logger.info(f"Found {len(urls) - len(misses)}/{len(urls)} variants in {CACHE_JSON}")
+        return misses
+
+    try:
+        urls = [url for product_type, urls in all_variants.items() for url in urls]
+        if fingerprints is not None:
+            urls, _ = fingerprints.partition(urls)
+        if use_product_caches:
+            urls = write_cached(urls)
+        if bulk:
+            wanted = set(urls)
+            # the first wanted variant of each product stands in for all of its colors
+            first_url = {
+                product_name: next(url for url in colors if url in wanted)
+                for product_name, colors in bulk_products.items() if wanted & set(colors)
+            }
 
-    driver.quit()
-    csv.close()
+            def write_product(product_name, dimensions_and_weight):
+                dimensions, weight = dimensions_and_weight
+                for url, color in bulk_products[product_name].items():
+                    if url in wanted:
+                        record = {"product_name": product_name, "color": color, "dimensions": dimensions, "weight": weight, "image_urls": bulk_images[url]}
+                        image_urls_manifest.add((product_name, color), bulk_images[url], replace=True)
+                        cache.put(url, record)
+                        write_row(url, record)
+
+            pool.map(
+                lambda driver, product_name: get_product_dimensions(first_url[product_name], driver),
+                list(first_url),
+                on_result=write_product,
+            )
+        else:
+            pool.map(
+                lambda driver, url: get_product_data(url, driver, image_urls_manifest, cache),
+                urls,
+                on_result=write_row,
+            )
+    finally:
+        image_urls_manifest.close()
+        cache.close()
+        pool.close()
+        catalog.close()
+        if fingerprints is not None:
+            fingerprints.finish("awaytravel_data", CSV_HEADERS, detect_removed=discovery_complete)
     
     logger.success("Scraping completed successfully")
 
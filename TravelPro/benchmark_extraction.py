@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from shared.browser import setup_driver
+from travelpro import EXTRACTORS, parse_tab_paragraphs, wait_for_body
+
+# Benchmark of get_product_details' extraction step: the old per-element WebDriver path against the single
+# execute_script round trip. Every WebDriver command goes through driver.execute, so both the wall time and
+# the number of chromedriver round trips are reported. Pass product page urls
+# (python benchmark_extraction.py https://travelpro.com/products/...); without any, a local page with the
+# same markup as a TravelPro product page is used.
+
+REPEAT = 5
+
+
+def synthetic_page(paragraphs=8, photos=12):
+    tab = "".join(
+        ["<p>&nbsp:</p>", "<p><strong>Features:</strong> Spinner wheels</p>", "<p><strong>Warranty:</strong> Lifetime</p>",
+         "<p><strong>Dimensions:</strong> 22\" x 14\" x 9\"</p>", "<p><strong>Weight:</strong> 7.8 lbs</p>"]
+        + [f"<p>Feature {i}</p>" for i in range(paragraphs)]
+    )
+    gallery = "".join(
+        f'<div class="product-single__photo-wrapper"><div class="product-single__photo" data-src="//travelpro.com/cdn/shop/files/{i}_{{width}}x.jpg"></div></div>'
+        for i in range(photos)
+    )
+    return (
+        "<html><body>"
+        f'<div class="product-single__photos">{gallery}<span>thumbnails</span></div>'
+        '<div class="cstm_tabs_section">'
+        '<div class="tab-container"><div class="tabcontent"><p>Description</p></div></div>'
+        f'<div class="tab-container"><div class="tabcontent">{tab}</div></div>'
+        "</div></body></html>"
+    )
+
+
+def count_commands(driver):
+    counter = {"commands": 0}
+    execute = driver.execute
+
+    def counted(*args, **kwargs):
+        counter["commands"] += 1
+        return execute(*args, **kwargs)
+
+    driver.execute = counted
+    return counter
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark TravelPro product page extraction")
+    parser.add_argument("urls", nargs="*", help="travelpro product page urls")
+    args = parser.parse_args()
+
+    urls = args.urls
+    if not urls:
+        with tempfile.NamedTemporaryFile("w", suffix=".html", delete=False, encoding="utf-8") as f:
+            f.write(synthetic_page())
+        urls = ["file://" + f.name]
+
+    driver = setup_driver()
+    counter = count_commands(driver)
+    try:
+        for url in urls:
+            driver.get(url)
+            wait_for_body(driver)
+            results = {}
+            for name, extract in EXTRACTORS.items():
+                timings = []
+                for _ in range(REPEAT):
+                    counter["commands"] = 0
+                    start = time.perf_counter()
+                    fields = extract(driver)
+                    timings.append(time.perf_counter() - start)
+                results[name] = (fields, min(timings), counter["commands"])
+            assert results["script"][0] == results["elements"][0], url
+            print(f"{url} ({len(results['script'][0]['images'])} images, {parse_tab_paragraphs(results['script'][0]['paragraphs'])})")
+            for name, (_, seconds, commands) in results.items():
+                print(f"  {name:<10}{seconds * 1000:10.2f} ms{commands:6d} round trips")
+            print(f"  {'speedup':<10}{results['elements'][1] / results['script'][1]:10.1f}x")
+    finally:
+        driver.quit()
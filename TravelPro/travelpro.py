@@ -1,15 +1,30 @@
-import undetected_chromedriver as uc
 import json
 import os
-import csv
-import time
+import sys
+import threading
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from loguru import logger
 
-BASE_PAGE = "https://travelpro.com/collections/carry-on-luggage?products.size=50"
-csv_name = "TravelPro.csv"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import catalog_db, shopify
+from shared.browser_pool import BrowserPool, HostRateLimiter
+from shared.delta import FingerprintStore
+from shared.catalog import open_catalog
+from shared.image_urls import normalize_urls
+
+LISTING_PAGE_SIZE = 50  # tiles the collection page shows, a full page may have more products behind it
+BASE_PAGE = f"https://travelpro.com/collections/carry-on-luggage?products.size={LISTING_PAGE_SIZE}"
+HOST = "travelpro.com"
+COLLECTION_HANDLE = "carry-on-luggage"
+catalog_name = "TravelPro"
+WORKERS = 3
+REQUESTS_PER_SECOND = 0.5  # travelpro.com budget shared by all browsers
+TTL_HOURS = 24 * 7  # incremental runs refetch colors older than this
+
+# images.json is read-modified-written, so pool workers take turns
+images_lock = threading.Lock()
 
 def clean_product_name(product_name):
     return product_name.lower().replace(" ", "-").replace("®", "")
@@ -17,6 +32,8 @@ def clean_product_name(product_name):
 def wait_for_body(driver):
     WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
 
+# returns ({product name: {color name: url}}, True if the page listed the whole collection).
+# a list that may be cut off isn't cached
 def get_product_urls(driver):
     product_urls = {}
 
@@ -26,7 +43,7 @@ def get_product_urls(driver):
         if input() == "y":
             with open("product_urls.json", "r") as f:
                 product_urls = json.load(f)
-                return product_urls
+                return product_urls, True
     
     # if not, get the product urls
     driver.get(BASE_PAGE)
@@ -51,45 +68,69 @@ def get_product_urls(driver):
             url = product.find_element(By.TAG_NAME, "a").get_attribute("href")
             product_urls[product_name]["DEFAULT"] = url
 
+    if len(products) >= LISTING_PAGE_SIZE:
+        logger.warning(f"The collection page is full ({len(products)} tiles) and may be cut off, not saving product_urls.json. Bulk mode lists every product")
+        return product_urls, False
+
     # save the product_urls to a json file
     with open("product_urls.json", "w") as f:
         json.dump(product_urls, f)
-    return product_urls
+    return product_urls, True
+
+# BULK MODE: the collection's products.json has every product, color and image in a few requests, so only
+# the dimensions tab needs a browser. returns (product_urls like get_product_urls, {product name: {color name: image urls}})
+def get_product_urls_from_json(rate_limiter=None):
+    product_urls = {}
+    product_images = {}
+    for product in shopify.collection_products(HOST, COLLECTION_HANDLE, rate_limiter):
+        colors = shopify.color_variants(product)
+        product_urls[product["title"]] = {color_name: shopify.product_url(HOST, product, variants[0]) for color_name, variants in colors.items()}
+        product_images[product["title"]] = {color_name: shopify.variant_images(product, variants) for color_name, variants in colors.items()}
+    return product_urls, product_images
 
 def add_images_to_json(product_name, color_name, image_urls):
-    if os.path.exists("images.json"):
-        with open("images.json", "r") as f:
-            images = json.load(f)
-    else:
-        images = {}
-    if product_name not in images:
-        images[product_name] = {}
-    if color_name not in images[product_name]:
-        images[product_name][color_name] = []
-    images[product_name][color_name] = image_urls
-    with open("images.json", "w") as f:
-        json.dump(images, f)
-
-def add_product_to_csv(product_name, color_name, dimensions, weight):
-    with open(csv_name, "a", newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(["TravelPro",product_name, color_name, dimensions, weight])
-
-def get_product_details(driver, product_name, color_name, url):
-    logger.info(f"Getting product details for {product_name} {color_name} at {url}")
-    driver.get(url)
-    wait_for_body(driver)
-    # get the tab with features and dimensions
+    with images_lock:
+        if os.path.exists("images.json"):
+            with open("images.json", "r") as f:
+                images = json.load(f)
+        else:
+            images = {}
+        if product_name not in images:
+            images[product_name] = {}
+        if color_name not in images[product_name]:
+            images[product_name][color_name] = []
+        images[product_name][color_name] = normalize_urls(image_urls)
+        with open("images.json", "w") as f:
+            json.dump(images, f)
+
+# pulls the tab paragraphs and gallery image urls out of the page in a single execute_script call,
+# instead of one chromedriver round trip per find_element/get_attribute
+EXTRACT_SCRIPT = """
+const section = document.querySelector(".cstm_tabs_section");
+const tab = section.querySelectorAll(".tab-container")[1].querySelector(".tabcontent");
+const photos = document.querySelector(".product-single__photos");
+const images = [];
+for (const div of photos.children) {
+    if (div.tagName !== "DIV") continue;
+    const img = div.querySelector(":scope > div");
+    if (img) images.push(img.getAttribute("data-src"));
+}
+return {
+    paragraphs: Array.from(tab.getElementsByTagName("p"), p => p.innerHTML),
+    images: images,
+};
+"""
+
+# "script": everything in one execute_script round trip. "elements": the old path, one WebDriver call per
+# element and attribute (a few dozen per product), kept for comparison in benchmark_extraction.py
+EXTRACTION = "script"
+
+def extract_fields_with_script(driver):
+    return driver.execute_script(EXTRACT_SCRIPT)
+
+def extract_fields_with_elements(driver):
     tab = driver.find_element(By.CLASS_NAME, "cstm_tabs_section").find_elements(By.CLASS_NAME,"tab-container")[1].find_element(By.CLASS_NAME, "tabcontent")
-    print(tab.find_elements(By.TAG_NAME, "p")[0].get_attribute("innerHTML"))
-    if tab.find_elements(By.TAG_NAME, "p")[0].get_attribute("innerHTML") == "&nbsp:":
-        dimensions = tab.find_elements(By.TAG_NAME, "p")[3].get_attribute("innerHTML").split("</strong>")[1]
-        weight = tab.find_elements(By.TAG_NAME, "p")[4].get_attribute("innerHTML").split("</strong>")[1].strip()
-    else:
-        dimensions = tab.find_elements(By.TAG_NAME, "p")[2].get_attribute("innerHTML").split("</strong>")[1]
-        weight = tab.find_elements(By.TAG_NAME, "p")[3].get_attribute("innerHTML").split("</strong>")[1].strip()
-
-    # IMAGES
+    paragraphs = [p.get_attribute("innerHTML") for p in tab.find_elements(By.TAG_NAME, "p")]
     images = driver.find_element(By.CLASS_NAME, "product-single__photos")
     image_urls = []
     for div in images.find_elements(By.XPATH, "./div"):
@@ -98,33 +139,99 @@ def get_product_details(driver, product_name, color_name, url):
             image_urls.append(img.get_attribute("data-src"))
         except:
             continue
-    add_images_to_json(product_name, color_name, image_urls)
+    return {"paragraphs": paragraphs, "images": image_urls}
+
+EXTRACTORS = {"script": extract_fields_with_script, "elements": extract_fields_with_elements}
+
+# dimensions and weight from the features tab paragraphs, which shift down by one when the tab starts with a spacer
+def parse_tab_paragraphs(paragraphs):
+    if paragraphs[0] == "&nbsp:":
+        dimensions = paragraphs[3].split("</strong>")[1]
+        weight = paragraphs[4].split("</strong>")[1].strip()
+    else:
+        dimensions = paragraphs[2].split("</strong>")[1]
+        weight = paragraphs[3].split("</strong>")[1].strip()
+    return dimensions, weight
+
+def load_fields(driver, url, extraction=EXTRACTION):
+    driver.get(url)
+    wait_for_body(driver)
+    # the tab with features and dimensions, and the IMAGES
+    fields = EXTRACTORS[extraction](driver)
+    logger.debug(fields["paragraphs"][0])
+    return fields
+
+def get_product_details(driver, product_name, color_name, url, extraction=EXTRACTION):
+    logger.info(f"Getting product details for {product_name} {color_name} at {url}")
+    fields = load_fields(driver, url, extraction)
+    dimensions, weight = parse_tab_paragraphs(fields["paragraphs"])
+    add_images_to_json(product_name, color_name, fields["images"])
 
     product_details = (product_name, color_name, dimensions, weight)
 
     return product_details
 
+# bulk mode: every color shares the product's dimensions tab, so one page per product is enough
+def get_product_dimensions(driver, product_name, url, extraction=EXTRACTION):
+    logger.info(f"Getting dimensions for {product_name} at {url}")
+    fields = load_fields(driver, url, extraction)
+    return parse_tab_paragraphs(fields["paragraphs"])
 
 if __name__ == "__main__":
-    driver = uc.Chrome(use_subprocess=False)
-    product_urls = get_product_urls(driver)
-    # if TravelPro.csv exists, change file name to TravelPro(1).csv. If TravelPro(1).csv exists, change file name to TravelPro(2).csv, and so on.
-    if os.path.exists(csv_name):
-        i = 1
-        while os.path.exists(f"{csv_name}({i}).csv"):
-            i += 1
-        csv_name = f"{csv_name}({i}).csv"
-    
-    # column headers
-    with open(csv_name, "w") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Brand","Product Name","Color","Dimensions","Weight"])
-
-    for product_name in product_urls.keys():
-        for color_name, url in product_urls[product_name].items():
-            product_name,color_name,dimensions,weight = get_product_details(driver, product_name, color_name, url)
-            add_product_to_csv(product_name,color_name,dimensions,weight)
-            time.sleep(1)
-
-    driver.quit()
+    pool = BrowserPool(WORKERS, HostRateLimiter(REQUESTS_PER_SECOND))
+    fingerprints = None
+    catalog = None
+    # only a complete listing can tell which colors were removed from the site
+    discovery_complete = False
+    try:
+        logger.info("Would you like to use bulk mode (products.json, one browser page per product)? (y/n)")
+        bulk = input() == "y"
+        if bulk:
+            product_urls, product_images = get_product_urls_from_json(pool.rate_limiter)
+            discovery_complete = True
+        else:
+            product_urls, discovery_complete = get_product_urls(pool.drivers[0])
+        logger.info("Would you like to run incrementally (only refetch new or stale colors)? (y/n)")
+        fingerprints = FingerprintStore(".", TTL_HOURS) if input() == "y" else None
+        # TravelPro.parquet + TravelPro.csv, or TravelPro(1).parquet + TravelPro(1).csv if those exist, and so on
+        catalog = open_catalog(".", catalog_name, store=catalog_db.for_path(), retailer="TravelPro")
+
+        jobs = [
+            (product_name, color_name, url)
+            for product_name in product_urls.keys()
+            for color_name, url in product_urls[product_name].items()
+        ]
+        if fingerprints is not None:
+            stale_urls, _ = fingerprints.partition([url for _, _, url in jobs])
+            stale_urls = set(stale_urls)
+            jobs = [job for job in jobs if job[2] in stale_urls]
+
+        def save_details(job, details):
+            catalog.write(["TravelPro", *details], key=job[2], url=job[2])
+            if fingerprints is not None:
+                fingerprints.update(job[2], ["TravelPro", *details])
+
+        if bulk:
+            colors_of = {}
+            for job in jobs:
+                colors_of.setdefault(job[0], []).append(job)
+
+            def save_product(product_name, dimensions_and_weight):
+                for job in colors_of[product_name]:
+                    add_images_to_json(job[0], job[1], product_images[job[0]][job[1]])
+                    save_details(job, (job[0], job[1], *dimensions_and_weight))
+
+            pool.map(
+                lambda driver, product_name: get_product_dimensions(driver, product_name, colors_of[product_name][0][2]),
+                list(colors_of),
+                on_result=save_product,
+            )
+        else:
+            pool.map(lambda driver, job: get_product_details(driver, *job), jobs, on_result=save_details)
+    finally:
+        pool.close()
+        if catalog is not None:
+            catalog.close()
+        if fingerprints is not None:
+            fingerprints.finish("TravelPro", ["Brand","Product Name","Color","Dimensions","Weight"], detect_removed=discovery_complete)
     logger.success("Done!")
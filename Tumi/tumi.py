@@ -1,44 +1,44 @@
-import undetected_chromedriver as uc
-import time
-from bs4 import BeautifulSoup
 from loguru import logger
+import math
 import os
+import sys
 import json
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import catalog_db, image_manifest
+from shared.browser_pool import BrowserPool, HostRateLimiter
+from shared.catalog import open_catalog
+from shared.dimensions import schema_org_units, schema_org_quantity
+from shared.parsing import parse
+from shared.browser import fetch_html, log_page_timings, CAPTCHA_SOLVE_SECONDS
+
 # CAPTCHA TYPE: PX
 
-ALL_LUGGAGE_URL = "https://www.tumi.com/c/luggage/carryon-luggage/?pageNumber=6"
+HOST = "www.tumi.com"
+LISTING_URL = "https://www.tumi.com/c/luggage/carryon-luggage/"
 RAW_DATA_FOLDER = "Tumi_Raw"
+BASE_URLS_JSON = os.path.join(RAW_DATA_FOLDER, "tumi_base_urls.json")
+IMAGE_URLS_JSON = os.path.join(RAW_DATA_FOLDER, "image_urls.json")
+# the ItemList and Product JSON-LD are in the server rendered html, so a page is usable once the document has loaded
+PAGE_WAIT = "ready_state"
+PAGE_TIMEOUT = 20
+WORKERS = 3
+REQUESTS_PER_SECOND = 0.5  # tumi.com budget shared by all browsers
 
-def has_captcha(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    captcha_div = soup.find('div', class_='px-captcha-header')
-    if captcha_div and "Before we continue..." in captcha_div.text:
-        return True
-    return False
-
-def fetch_html(driver, url):
-    driver.get(url)
-    time.sleep(2)  # Wait for the page to load
-    html = driver.page_source
-    # Check for captcha
-    if has_captcha(html):
-        logger.warning("Captcha detected. Waiting 2 minutes for user to solve it...")
-        time.sleep(120)  # Wait for 2 minutes
-        html = driver.page_source
-        if has_captcha(html):
-            logger.error("Captcha still present after waiting.")
-            raise Exception("Captcha still present after waiting.")
-    return html
-
-def find_app_script_of_type(soup, type_name):
-    script_tags = soup.find_all("script", type="application/ld+json")
+def find_app_script_of_type(page, type_name):
+    script_tags = page.select('script[type="application/ld+json"]')
     for script_tag in script_tags:
-        if script_tag.string:
-            json_data = json.loads(script_tag.string)
-            if json_data.get("@type") == type_name:
-                logger.info(f"Found a script tag with type '{type_name}'")
-                return json_data
+        if script_tag.text().strip():
+            try:
+                json_data = json.loads(script_tag.text())
+            except json.JSONDecodeError:
+                continue
+            # a script can hold one object, a list of them or an @graph
+            candidates = json_data if isinstance(json_data, list) else json_data.get("@graph", [json_data])
+            for candidate in candidates:
+                if isinstance(candidate, dict) and candidate.get("@type") == type_name:
+                    logger.info(f"Found a script tag with type '{type_name}'")
+                    return candidate
     logger.warning(f"No script tag found with type '{type_name}'")
     return None
 
@@ -49,25 +49,53 @@ def create_directory_if_not_exists(directory):
     else:
         logger.info(f"Directory already exists: {directory}")
 
-def fetch_base_luggage_urls(driver):
-    if os.path.exists(os.path.join(RAW_DATA_FOLDER, "tumi_base_urls.json")):
+def listing_url(page_number):
+    return f"{LISTING_URL}?pageNumber={page_number}"
+
+def fetch_listing_page(driver, page_number, captcha_wait=0):
+    html = fetch_html(driver, listing_url(page_number), PAGE_WAIT, PAGE_TIMEOUT, captcha_wait)
+    return find_app_script_of_type(parse(html), "ItemList")
+
+# the first listing page gives numberOfItems and the page size, then every other page is fetched across the
+# pool at once. returns one ItemList with the items of all pages, without repeats
+def fetch_base_luggage_urls(pool):
+    if os.path.exists(BASE_URLS_JSON):
         user_input = input("tumi_base_urls.json already exists. Do you want to refetch product base URLs? (y/n): ").strip().lower()
         if user_input != "y":
             logger.info("Loading data from existing tumi_base_urls.json")
-            with open(os.path.join(RAW_DATA_FOLDER, "tumi_base_urls.json"), "r") as file:
+            with open(BASE_URLS_JSON, "r") as file:
                 return json.load(file)
-    html = fetch_html(driver, ALL_LUGGAGE_URL)
-    soup = BeautifulSoup(html, "html.parser")
-    json_data = find_app_script_of_type(soup, "ItemList")
-    num_items = json_data.get("numberOfItems")
-    logger.info(f"Found {num_items} items in the JSON data")
-    json.dump(json_data, open(os.path.join(RAW_DATA_FOLDER, "tumi_base_urls.json"), "w"), indent=2)
-    logger.info("Data successfully written to tumi_base_urls.json")
+    # the first page is loaded on its own so there's time to solve a captcha before the pool starts
+    first_page = fetch_listing_page(pool.drivers[0], 1, CAPTCHA_SOLVE_SECONDS)
+    if first_page is None:
+        # a changed layout or an unsolved captcha, there's no page count to go on
+        raise ValueError(f"No ItemList JSON-LD on {listing_url(1)}")
+    num_items = first_page.get("numberOfItems", 0)
+    page_size = len(first_page.get("itemListElement", []))
+    page_count = math.ceil(num_items / page_size) if page_size else 1
+    logger.info(f"Found {num_items} items, {page_size} per page, {page_count} pages")
+
+    pages = {1: first_page}
+    def collect(page_number, json_data):
+        if json_data is not None:
+            pages[page_number] = json_data
+    failures = pool.map(fetch_listing_page, list(range(2, page_count + 1)), on_result=collect, host_of=lambda page_number: HOST)
+    for page_number in failures:
+        logger.error(f"Could not load listing page {page_number}")
+
+    # pages can overlap (a later page may repeat the earlier ones), so items are kept once per url
+    items = {}
+    for page_number in sorted(pages):
+        for item in pages[page_number].get("itemListElement", []):
+            items.setdefault(item.get("url"), item)
+    json_data = dict(first_page, url=LISTING_URL, itemListElement=list(items.values()))
+    with open(BASE_URLS_JSON, "w") as file:
+        json.dump(json_data, file, indent=2)
+    logger.info(f"{len(items)} items successfully written to tumi_base_urls.json")
     return json_data
 
 def get_base_urls_list(json_data):
     base_urls = {}
-    print(json_data)
     for item in json_data.get("itemListElement", []):
         if base_urls.get(item.get("name")):
             base_urls[item.get("name")].append(item.get("url"))
@@ -76,13 +104,79 @@ def get_base_urls_list(json_data):
     logger.info(f"Extracted {len(base_urls)} products")
     return base_urls
 
+def fetch_product(driver, url):
+    logger.info(f"Getting product data from {url}")
+    html = fetch_html(driver, url, PAGE_WAIT, PAGE_TIMEOUT)
+    product = find_app_script_of_type(parse(html), "Product")
+    if product is None:
+        raise ValueError(f"No Product JSON-LD on {url}")
+    return product
+
+def image_urls(image):
+    # image is a url, an ImageObject or a list of either
+    images = image if isinstance(image, list) else [image]
+    urls = []
+    for image in images:
+        url = (image.get("contentUrl") or image.get("url")) if isinstance(image, dict) else image
+        if url:
+            urls.append("https:" + url if url.startswith("//") else url)
+    return urls
+
+# "22 in", "3.5 kg", ... for the text columns, with the unit codes spelled the way parse_dimensions reads them
+def quantity_text(value):
+    number, unit = schema_org_quantity(value)
+    if number is None:
+        return value if isinstance(value, str) else None
+    return f"{number:g} {unit or ''}".strip()
+
+# one record per color. the colors are listed under hasVariant, each inheriting what it doesn't set from the product
+def product_variants(product, url):
+    variants = []
+    for variant in product.get("hasVariant") or [product]:
+        variant = dict({k: v for k, v in product.items() if k != "hasVariant"}, **variant)
+        height, width, depth = (quantity_text(variant.get(axis)) for axis in ("height", "width", "depth"))
+        dimensions = f"{height} H x {width} W x {depth} D" if height and width and depth else None
+        variants.append({
+            "key": variant.get("sku") or variant.get("productID") or variant.get("url") or url,
+            "name": variant.get("name"),
+            "color": variant.get("color") or "DEFAULT",
+            "dimensions": dimensions,
+            "weight": quantity_text(variant.get("weight")),
+            "structured": schema_org_units(variant),
+            "url": variant.get("url") or url,
+            "image_urls": image_urls(variant.get("image")),
+            "raw": variant,
+        })
+    return variants
+
 def main():
     create_directory_if_not_exists(RAW_DATA_FOLDER)
-    driver = uc.Chrome(headless=False, use_subprocess=False)
-    base_urls_json = fetch_base_luggage_urls(driver)
-    base_urls = get_base_urls_list(base_urls_json)
-    print(base_urls)
-    driver.quit()
+    pool = BrowserPool(WORKERS, HostRateLimiter(REQUESTS_PER_SECOND))
+    image_urls_manifest = image_manifest.for_path(IMAGE_URLS_JSON)
+    catalog = None
+    try:
+        base_urls = get_base_urls_list(fetch_base_luggage_urls(pool))
+        urls = list(dict.fromkeys(url for product_urls in base_urls.values() for url in product_urls))
+        catalog = open_catalog(RAW_DATA_FOLDER, "tumi_data", store=catalog_db.for_path(), retailer="Tumi")
+
+        def save_product(url, product):
+            for variant in product_variants(product, url):
+                image_urls_manifest.add((variant["name"], variant["color"]), variant["image_urls"], replace=True)
+                catalog.write(
+                    ["Tumi", variant["name"], variant["color"], variant["dimensions"], variant["weight"]],
+                    key=variant["key"], structured=variant["structured"],
+                    url=variant["url"], image_urls=variant["image_urls"], raw=variant["raw"],
+                )
+
+        failures = pool.map(fetch_product, urls, on_result=save_product, host_of=lambda url: HOST)
+        for url in failures:
+            logger.error(f"Could not get product data from {url}")
+    finally:
+        image_urls_manifest.close()
+        pool.close()
+        if catalog is not None:
+            catalog.close()
+        log_page_timings()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
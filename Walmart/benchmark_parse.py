@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from parsel import Selector
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from walmart import next_data, parse_search
+
+# Microbenchmark of the __NEXT_DATA__ extraction in parse_search: the old parsel DOM + json.loads path
+# against the byte scan + orjson path. Pass saved search pages (python benchmark_parse.py page1.html ...);
+# without any, a synthetic ~1 MB search page with the same shape is used.
+
+REPEAT = 20
+
+
+def dom_next_data(html_text):
+    data_script = Selector(text=html_text).xpath('//script[@id="__NEXT_DATA__"]/text()').get()
+    return json.loads(data_script)
+
+
+def synthetic_page(items=40):
+    item = {
+        "__typename": "Product",
+        "usItemId": "1681977304",
+        "name": "Hardshell Carry-On Luggage 20\" Lightweight Hardside Suitcase with Spinner Wheels",
+        "canonicalUrl": "/ip/Hardshell-Carry-On-Luggage/1681977304",
+        "imageInfo": {"thumbnailUrl": "https://i5.walmartimages.com/seo/a.jpeg?odnHeight=180&odnWidth=180&odnBg=FFFFFF"},
+        "priceInfo": {"linePrice": "$59.99", "itemPrice": "$59.99"},
+        "badges": {"flags": [{"text": "Best seller"}] * 3},
+        "variantList": [{"name": f"Color {i}", "image": "https://i5.walmartimages.com/x.jpeg"} for i in range(8)],
+    }
+    data = {
+        "props": {"pageProps": {"initialData": {"searchResult": {
+            "itemStacks": [{"count": 1000, "items": [dict(item, usItemId=str(i)) for i in range(items)]}],
+            "facets": [{"name": "Brand", "values": [{"name": f"Brand {i}", "itemCount": i} for i in range(200)]}],
+        }}}},
+        "buildId": "x" * 32,
+    }
+    tiles = "".join(
+        f'<div class="mb0 ph1 pa0-xl bb b--near-white w-25"><a href="/ip/{i}"><img src="/img/{i}.jpeg" alt="item {i}">'
+        f'<span class="w_iUH7">Carry-on suitcase {i}</span></a></div>'
+        for i in range(4000)
+    )
+    return (
+        f"<html><head><title>carry on luggage</title><style>{'.c{color:red}' * 5000}</style></head>"
+        f"<body><main>{tiles}</main>"
+        f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}</script></body></html>'
+    )
+
+
+def bench(label, function, page):
+    seconds = min(timeit.repeat(lambda: function(page), number=1, repeat=REPEAT))
+    print(f"  {label:<28}{seconds * 1000:8.2f} ms")
+    return seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark __NEXT_DATA__ extraction on Walmart search pages")
+    parser.add_argument("pages", nargs="*", help="saved walmart search pages")
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, "r", encoding="utf-8") as f:
+            pages.append((path, f.read()))
+    if not pages:
+        pages.append(("synthetic search page", synthetic_page()))
+
+    for name, page in pages:
+        assert next_data(page) == dom_next_data(page)
+        print(f"{name} ({len(page) / 1e6:.2f} MB, {len(parse_search(page)[0])} items)")
+        dom = bench("parsel DOM + json.loads", dom_next_data, page)
+        scan = bench("byte scan + orjson", next_data, page)
+        print(f"  {'speedup':<28}{dom / scan:8.1f}x")
@@ -1,15 +1,54 @@
 import asyncio
 import json
 import math
+import os
+import random
+import re
+import sys
 from urllib.parse import urlencode
 
 import httpx
 import pandas as pd
 from loguru import logger
-from parsel import Selector
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import catalog_db, keyed_cache
+from shared.image_urls import sized_url
+from shared.parsing import parse
+from shared.dimensions import normalize_frame, NUMERIC_COLUMNS, CONFIDENCE_COLUMN
 
 # Base URL for Walmart search
 BASE_URL = "https://www.walmart.com/search"
+HOST = "www.walmart.com"
+RETAILER = "Walmart"
+QUERY = "carry on luggage"
+NEXT_DATA_MARKER = 'id="__NEXT_DATA__"'
+ITEMS_PER_PAGE = 40
+
+CONCURRENCY = 4             # search pages in flight at once
+MAX_ATTEMPTS = 5            # per page, including the first try
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# walmart serves at most 25 pages per query, so bigger result sets are split into shards
+MAX_PAGES_PER_QUERY = 25
+MAX_RESULTS_PER_QUERY = MAX_PAGES_PER_QUERY * ITEMS_PER_PAGE
+SHARD_BY = ("price", "brand")
+# starting price bands, any band still over the cap is halved down to MIN_PRICE_BAND dollars wide
+PRICE_BANDS = [(0, 50), (50, 100), (100, 200), (200, 400), (400, None)]
+MIN_PRICE_BAND = 5
+MAX_BRAND_SHARDS = 40
+
+DETAIL_CONCURRENCY = 8          # product pages in flight at once
+DETAIL_CACHE = "walmart_detail_cache.json"  # item id -> specifications parsed from its product page
+DETAIL_TTL_HOURS = 24 * 7       # cached details older than this are fetched again
 
 # Headers to mimic a real browser
 HEADERS = {
@@ -23,108 +62,503 @@ HEADERS = {
 }
 
 
+DIMENSION_ORDER_PATTERN = re.compile(r'\(\s*([LWHD])\s*x\s*([LWHD])\s*x\s*([LWHD])\s*\)', re.IGNORECASE)
+DIMENSIONS_PATTERN = re.compile(r'(\d+\.?\d*)\s?[xX×]\s?(\d+\.?\d*)\s?[xX×]\s?(\d+\.?\d*)\s?(inches|inch|")?', re.IGNORECASE)
+
+
 def extract_dimensions(text):
     """
     Extract dimensions from a given text string.
     Looks for patterns like '20 x 14 x 9 inches'.
     """
-    import re
-
-    pattern = re.compile(r'(\d+\.?\d*)\s?[xX×]\s?(\d+\.?\d*)\s?[xX×]\s?(\d+\.?\d*)\s?(inches|inch|")?', re.IGNORECASE)
-    match = pattern.search(text)
+    match = DIMENSIONS_PATTERN.search(text)
     if match:
         return f"{match.group(1)} x {match.group(2)} x {match.group(3)}"
     return None
 
 
-def parse_search(html_text):
+def scan_next_data(html_text):
     """
-    Extract product data from Walmart search HTML response.
+    Fast path: find the __NEXT_DATA__ script by scanning for its id instead of building a DOM
+    of the whole ~1 MB page, and decode it with orjson when it is installed.
+    Returns None when the scan or the decode fails.
+    """
+    marker = NEXT_DATA_MARKER if isinstance(html_text, str) else NEXT_DATA_MARKER.encode()
+    position = html_text.find(marker)
+    if position < 0:
+        return None
+    start = html_text.find(">" if isinstance(html_text, str) else b">", position) + 1
+    end = html_text.find("</script>" if isinstance(html_text, str) else b"</script>", start)
+    if start <= 0 or end < 0:
+        return None
+    try:
+        return json_loads(html_text[start:end])
+    except ValueError:
+        return None
+
+
+def next_data(html_text):
+    """
+    Return the parsed __NEXT_DATA__ json of a Walmart page, or None.
     """
-    sel = Selector(text=html_text)
-    data_script = sel.xpath('//script[@id="__NEXT_DATA__"]/text()').get()
+    data = scan_next_data(html_text)
+    if data is not None:
+        return data
+
+    # slow path for markup the scan doesn't recognise
+    logger.debug("Byte scan for __NEXT_DATA__ failed, falling back to the DOM")
+    script = parse(html_text).select_one('script#__NEXT_DATA__')
+    data_script = script.text() if script is not None else None
     if not data_script:
         logger.warning("No __NEXT_DATA__ script tag found.")
-        return [], 0
+        return None
+
+    try:
+        return json.loads(data_script)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing JSON data: {e}")
+        return None
+
 
+def parse_search_result(html_text):
+    """
+    Return the searchResult object from a Walmart search page's __NEXT_DATA__, or None.
+    """
+    data = next_data(html_text)
     try:
-        data = json.loads(data_script)
-        item_stacks = data["props"]["pageProps"]["initialData"]["searchResult"]["itemStacks"]
-        if not item_stacks:
-            logger.warning("No itemStacks found in JSON data.")
-            return [], 0
-
-        items = item_stacks[0].get("items", [])
-        total_results = item_stacks[0].get("count", 0)
-        return items, total_results
-    except (KeyError, json.JSONDecodeError) as e:
+        return data["props"]["pageProps"]["initialData"]["searchResult"]
+    except (KeyError, TypeError) as e:
         logger.error(f"Error parsing JSON data: {e}")
+        return None
+
+
+def search_items(search_result):
+    """
+    Return (items, total_results) from a searchResult object.
+    """
+    if not search_result:
         return [], 0
+    item_stacks = search_result.get("itemStacks") or []
+    if not item_stacks:
+        logger.warning("No itemStacks found in JSON data.")
+        return [], 0
+
+    # the first stack holds the main results and their count, later ones (e.g. more results,
+    # related products) hold items too. ad placeholders and banners have no product url
+    items = [item for stack in item_stacks for item in stack.get("items") or [] if item.get("canonicalUrl")]
+    total_results = item_stacks[0].get("count", 0)
+    return items, total_results
 
 
-async def fetch_page(client, params):
+def parse_search(html_text):
+    """
+    Extract product data from Walmart search HTML response.
+    """
+    return search_items(parse_search_result(html_text))
+
+
+def facet_values(search_result, name):
+    """
+    Return the value names of one facet (e.g. "brand") listed in a searchResult, most items first.
+    """
+    for facet in (search_result or {}).get("facets") or []:
+        if (facet.get("name") or "").lower() == name:
+            values = [v for v in facet.get("values") or [] if v.get("name")]
+            values.sort(key=lambda v: v.get("itemCount") or 0, reverse=True)
+            return [v["name"] for v in values]
+    return []
+
+
+def item_id(item):
+    return item.get("usItemId") or item.get("id") or item.get("canonicalUrl")
+
+
+def new_stats():
+    return {"pages": 0, "retried": 0, "failed": 0, "items": 0, "duplicates": 0, "failed_pages": []}
+
+
+def new_detail_stats():
+    return {"pages": 0, "retried": 0, "failed": 0, "fetched": 0, "cached": 0, "failed_pages": []}
+
+
+def log_summary(stats):
+    logger.info(
+        f"Pages fetched: {stats['pages']}, retried: {stats['retried']}, failed: {stats['failed']}, "
+        f"items: {stats['items']} ({stats['duplicates']} duplicates across shards dropped)"
+    )
+    if stats["failed_pages"]:
+        logger.warning(f"Failed pages: {stats['failed_pages']}")
+
+
+def backoff_delay(attempt, response=None):
+    """
+    Exponential backoff with full jitter, or the server's Retry-After when it sends one.
+    """
+    if response is not None and response.headers.get("retry-after", "").isdigit():
+        return min(float(response.headers["retry-after"]), BACKOFF_MAX_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+async def fetch_page(client, semaphore, params, stats):
     """
     Fetch a single search results page.
     """
-    url = f"{BASE_URL}?{urlencode(params)}"
-    try:
-        response = await client.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.text
-    except httpx.HTTPError as e:
-        logger.error(f"HTTP error while fetching {url}: {e}")
-        return ""
+    return await fetch_url(client, semaphore, f"{BASE_URL}?{urlencode(params)}", stats)
 
 
-async def scrape_walmart_carry_on_luggage(max_pages=3):
+async def fetch_url(client, semaphore, url, stats):
     """
-    Scrape carry-on luggage data from Walmart.
+    Fetch a page, retrying 429/5xx and network errors.
+    Returns None (and counts the page as failed) once the attempts run out.
     """
-    results = []
-    async with httpx.AsyncClient(http2=True, timeout=30.0) as client:
-        # Fetch the first page to determine total results
-        params = {"q": "carry on luggage", "page": 1}
-        html_text = await fetch_page(client, params)
-        items, total_results = parse_search(html_text)
-        results.extend(items)
-
-        # Calculate total pages
-        items_per_page = len(items) if items else 40
-        total_pages = math.ceil(total_results / items_per_page)
+    for attempt in range(MAX_ATTEMPTS):
+        response = None
+        try:
+            async with semaphore:
+                response = await client.get(url, headers=HEADERS)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                stats["pages"] += 1
+                return response.text
+            logger.warning(f"HTTP {response.status_code} for {url} (attempt {attempt + 1}/{MAX_ATTEMPTS})")
+        except httpx.HTTPStatusError as e:
+            # other 4xx won't get better by retrying
+            logger.error(f"HTTP error while fetching {url}: {e}")
+            break
+        except httpx.HTTPError as e:
+            logger.warning(f"Network error for {url} (attempt {attempt + 1}/{MAX_ATTEMPTS}): {e}")
+        if attempt + 1 < MAX_ATTEMPTS:
+            stats["retried"] += 1
+            await asyncio.sleep(backoff_delay(attempt, response))
+    stats["failed"] += 1
+    stats["failed_pages"].append(url)
+    return None
+
+
+async def iter_search_items(client, semaphore, params, stats, max_pages=None, first_page=None):
+    """
+    Yield search result items page by page as each page completes.
+    The first page gives the result count, the rest are fetched concurrently (bounded by the semaphore).
+    first_page is page 1's html when the caller already fetched it.
+    """
+    html_text = first_page
+    if html_text is None:
+        html_text = await fetch_page(client, semaphore, {**params, "page": 1}, stats)
+    if html_text is None:
+        return
+    items, total_results = parse_search(html_text)
+    for item in items:
+        yield item
+
+    items_per_page = min(len(items), ITEMS_PER_PAGE) if items else ITEMS_PER_PAGE
+    total_pages = math.ceil(total_results / items_per_page) if total_results else 1
+    # walmart stops serving results past this page whatever the count says
+    total_pages = min(total_pages, MAX_PAGES_PER_QUERY)
+    if max_pages is not None:
         total_pages = min(total_pages, max_pages)
+    logger.info(f"{params}: total results: {total_results}, pages to scrape: {total_pages}")
 
-        logger.info(f"Total results: {total_results}, Pages to scrape: {total_pages}")
+    tasks = [
+        asyncio.ensure_future(fetch_page(client, semaphore, {**params, "page": page}, stats))
+        for page in range(2, total_pages + 1)
+    ]
+    try:
+        for next_page in asyncio.as_completed(tasks):
+            html_text = await next_page
+            if html_text is None:
+                continue
+            items, _ = parse_search(html_text)
+            for item in items:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
 
-        # Fetch remaining pages
-        tasks = []
-        for page in range(2, total_pages + 1):
-            params = {"q": "carry on luggage", "page": page}
-            tasks.append(fetch_page(client, params))
 
-        pages = await asyncio.gather(*tasks)
-        for html in pages:
-            items, _ = parse_search(html)
-            results.extend(items)
+def price_params(query, low, high):
+    params = {"q": query, "min_price": low}
+    if high is not None:
+        params["max_price"] = high
+    return params
 
-    # Process results
-    data = []
-    for item in results:
-        title = item.get("title", "")
-        image_url = item.get("imageInfo", {}).get("thumbnailUrl", "")
-        product_page_url = f"https://www.walmart.com{item.get('canonicalUrl', '')}"
-        dimensions = extract_dimensions(title)
-        data.append({
-            "Title": title,
-            "Image_URL": image_url,
-            "Product_Page_URL": product_page_url,
-            "Dimensions": dimensions,
+
+def brand_shards(search_result, params):
+    """
+    Shards for the brands listed in a searchResult's facets, narrowing params (the query or one price band).
+    """
+    brands = facet_values(search_result, "brand")[:MAX_BRAND_SHARDS]
+    return [({**params, "facet": f"brand:{brand}"}, None) for brand in brands]
+
+
+async def price_shards(client, semaphore, query, low, high, stats, shard_by=SHARD_BY):
+    """
+    Split a price band in half until every band fits under walmart's per-query result cap.
+    Returns [(params, page 1 html)], the probe page is reused as the shard's first page.
+    A band still over the cap at MIN_PRICE_BAND dollars is also split by brand when shard_by has "brand".
+    """
+    params = price_params(query, low, high)
+    html_text = await fetch_page(client, semaphore, {**params, "page": 1}, stats)
+    if html_text is None:
+        return []
+    search_result = parse_search_result(html_text)
+    _, total_results = search_items(search_result)
+    if total_results <= MAX_RESULTS_PER_QUERY:
+        return [(params, html_text)]
+    if high is not None and high - low <= MIN_PRICE_BAND:
+        shards = [(params, html_text)]
+        if "brand" in shard_by:
+            shards += brand_shards(search_result, params)
+        return shards
+    middle = low * 2 if high is None else (low + high) / 2
+    halves = await asyncio.gather(
+        price_shards(client, semaphore, query, low, middle, stats, shard_by),
+        price_shards(client, semaphore, query, middle, high, stats, shard_by),
+    )
+    return halves[0] + halves[1]
+
+
+async def plan_shards(client, semaphore, query, stats, shard_by=SHARD_BY):
+    """
+    Split one logical query into shards that each fit under walmart's per-query result cap.
+    Price bands split the search exhaustively, so brands are only added inside bands that are still too
+    large at MIN_PRICE_BAND dollars, or for the whole query when shard_by has no "price".
+    """
+    params = {"q": query}
+    html_text = await fetch_page(client, semaphore, {**params, "page": 1}, stats)
+    if html_text is None:
+        return []
+    search_result = parse_search_result(html_text)
+    _, total_results = search_items(search_result)
+    if total_results <= MAX_RESULTS_PER_QUERY or not shard_by:
+        return [(params, html_text)]
+
+    if "price" in shard_by:
+        bands = await asyncio.gather(*(
+            price_shards(client, semaphore, query, low, high, stats, shard_by) for low, high in PRICE_BANDS
+        ))
+        shards = [shard for band in bands for shard in band]
+    else:
+        shards = brand_shards(search_result, params)
+    logger.info(f"{total_results} results for {query!r}, split into {len(shards)} shards")
+    return shards
+
+
+async def iter_sharded_items(client, query, stats, max_pages=None, concurrency=CONCURRENCY, shard_by=SHARD_BY):
+    """
+    Crawl every shard of a query concurrently and yield each item once, de-duplicated by item id.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    shards = await plan_shards(client, semaphore, query, stats, shard_by)
+    found = asyncio.Queue()
+    done = object()
+
+    async def crawl(params, first_page):
+        try:
+            async for item in iter_search_items(client, semaphore, params, stats, max_pages, first_page):
+                await found.put(item)
+        finally:
+            await found.put(done)
+
+    tasks = [asyncio.ensure_future(crawl(params, first_page)) for params, first_page in shards]
+    seen = set()
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await found.get()
+            if item is done:
+                remaining -= 1
+                continue
+            key = item_id(item)
+            if key in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def item_record(item):
+    # the item shape varies, newer search results carry the title as "name"
+    title = item.get("title") or item.get("name") or ""
+    # search results only carry 180px thumbnails, ask the image service for the configured size instead
+    image_url = sized_url(item.get("imageInfo", {}).get("thumbnailUrl", "") or item.get("image", ""))
+    product_page_url = f"https://www.walmart.com{item.get('canonicalUrl', '')}"
+    return {
+        "Item_ID": item_id(item),
+        "Title": title,
+        "Brand": item.get("brand") or None,
+        "Image_URL": image_url,
+        "Product_Page_URL": product_page_url,
+        "Dimensions": extract_dimensions(title),
+        "Weight": None,
+    }
+
+
+def specification(specifications, word):
+    """
+    Return (name, value) of the first specification whose name mentions word, product ones first.
+    """
+    matches = [spec for spec in specifications if word in (spec.get("name") or "").lower() and spec.get("value")]
+    matches.sort(key=lambda spec: "product" not in spec["name"].lower())
+    if matches:
+        return matches[0]["name"], matches[0]["value"]
+    return None, None
+
+
+def labeled_dimensions(name, value):
+    """
+    Walmart states the axis order in the spec name, e.g. "Assembled Product Dimensions (L x W x H)": "14.00 x 9.00 x 22.00 Inches".
+    Rewrite the value with H/L/W labels so the numeric normalizer reads every axis correctly.
+    """
+    order = DIMENSION_ORDER_PATTERN.search(name or "")
+    match = DIMENSIONS_PATTERN.search(value or "")
+    if not order or not match:
+        return value
+    unit = "in" if not re.search(r'\bcm\b|centimet', value, re.IGNORECASE) else "cm"
+    return " x ".join(f"{number}{unit} {axis.upper()}" for number, axis in zip(match.groups()[:3], order.groups()))
+
+
+def parse_product_page(html_text):
+    """
+    Extract the structured specifications (dimensions, weight, brand, name) from a product page's __NEXT_DATA__.
+    """
+    data = next_data(html_text)
+    try:
+        page_data = data["props"]["pageProps"]["initialData"]["data"]
+    except (KeyError, TypeError):
+        return None
+    product = page_data.get("product") or {}
+    specifications = (page_data.get("idml") or {}).get("specifications") or []
+    dimensions_name, dimensions = specification(specifications, "dimensions")
+    _, weight = specification(specifications, "weight")
+    return {
+        "name": product.get("name"),
+        "brand": product.get("brand") or specification(specifications, "brand")[1],
+        "dimensions": labeled_dimensions(dimensions_name, dimensions),
+        "weight": weight,
+    }
+
+
+def detail_cache():
+    return keyed_cache.for_path(DETAIL_CACHE, DETAIL_TTL_HOURS)
+
+
+def log_detail_summary(stats):
+    logger.info(
+        f"Product details fetched: {stats['fetched']}, cached: {stats['cached']}, "
+        f"failed: {stats['failed']} (page requests retried: {stats['retried']})"
+    )
+    if stats["failed_pages"]:
+        logger.warning(f"Failed product pages: {stats['failed_pages']}")
+
+
+def merge_details(record, details):
+    record["Title"] = record["Title"] or details.get("name") or ""
+    record["Brand"] = details.get("brand") or record["Brand"]
+    # the product page's specifications beat dimensions guessed from the title
+    record["Dimensions"] = details.get("dimensions") or record["Dimensions"]
+    record["Weight"] = details.get("weight") or record["Weight"]
+
+
+async def enrich_with_details(client, records, stats, concurrency=DETAIL_CONCURRENCY):
+    """
+    Second stage: fetch every product page (bounded concurrency) and merge its specifications into the records.
+    Parsed details are cached by item id in DETAIL_CACHE for DETAIL_TTL_HOURS, so repeat runs only fetch new
+    or stale items.
+    """
+    cache = detail_cache()
+    semaphore = asyncio.Semaphore(concurrency)
+    details_of = {}
+    for record in records:
+        details = cache.get(record["Item_ID"])
+        if details is not None:
+            details_of[record["Item_ID"]] = details
+    new = [record for record in records if record["Item_ID"] not in details_of]
+    stats["cached"] = len(records) - len(new)
+    logger.info(f"Product details: {stats['cached']} cached, {len(new)} to fetch")
+
+    async def enrich(record):
+        html_text = await fetch_url(client, semaphore, record["Product_Page_URL"], stats)
+        if html_text is None:
+            return
+        details = parse_product_page(html_text)
+        if details is None:
+            logger.warning(f"No product data on {record['Product_Page_URL']}")
+            stats["failed"] += 1
+            stats["failed_pages"].append(record["Product_Page_URL"])
+            return
+        cache.put(record["Item_ID"], details)
+        details_of[record["Item_ID"]] = details
+        stats["fetched"] += 1
+
+    try:
+        await asyncio.gather(*(enrich(record) for record in new))
+    finally:
+        cache.close()
+    for record in records:
+        if record["Item_ID"] in details_of:
+            merge_details(record, details_of[record["Item_ID"]])
+    return records
+
+
+def save_to_catalog(df, store=None):
+    """
+    Upsert every item into the shared catalog database keyed by Item_ID, with its image and the product page
+    details it was enriched from as the raw payload.
+    """
+    store = store if store is not None else catalog_db.for_path()
+    cache = detail_cache()
+    records = []
+    for row in df.to_dict("records"):
+        records.append({
+            "product_key": row["Item_ID"],
+            "product_name": row["Title"],
+            "variant_key": row["Item_ID"],
+            "dimensions": row["Dimensions"] if isinstance(row["Dimensions"], str) else None,
+            "weight": row["Weight"] if isinstance(row["Weight"], str) else None,
+            "numeric": {column: None if pd.isna(row[column]) else float(row[column]) for column in NUMERIC_COLUMNS},
+            "url": row["Product_Page_URL"],
+            "image_urls": [row["Image_URL"]] if row["Image_URL"] else [],
+            "raw": cache.get(row["Item_ID"]),
         })
+    store.upsert_variants(RETAILER, records, host=HOST)
+    logger.info(f"Saved {len(records)} items to the catalog database")
 
+
+async def scrape_walmart_carry_on_luggage(max_pages=None, concurrency=CONCURRENCY, shard_by=SHARD_BY, details=True):
+    """
+    Scrape carry-on luggage data from Walmart, every page of every shard unless max_pages is given,
+    then enrich every item from its product page.
+    """
+    stats = new_stats()
+    data = []
+    async with httpx.AsyncClient(http2=True, timeout=30.0) as client:
+        async for item in iter_sharded_items(client, QUERY, stats, max_pages, concurrency, shard_by):
+            data.append(item_record(item))
+            stats["items"] += 1
+        log_summary(stats)
+        if details:
+            detail_stats = new_detail_stats()
+            await enrich_with_details(client, data, detail_stats)
+            log_detail_summary(detail_stats)
     return data
 
 
 if __name__ == "__main__":
-    data = asyncio.run(scrape_walmart_carry_on_luggage(max_pages=3))
+    data = asyncio.run(scrape_walmart_carry_on_luggage())
+    # numeric height/length/width (in) and weight (lb) in one vectorized pass, from the product page
+    # specifications where there are some and from the titles otherwise
     df = pd.DataFrame(data)
+    # only the parser falls back to the title, Dimensions/Weight stay empty when there is no value
+    source = pd.DataFrame({
+        "Dimensions": df["Dimensions"].fillna(df["Title"]),
+        "Weight": df["Weight"].fillna(df["Title"]),
+    })
+    parsed = normalize_frame(source)
+    for column in NUMERIC_COLUMNS + [CONFIDENCE_COLUMN]:
+        df[column] = parsed[column]
     df.to_csv("walmart_carry_on_luggage.csv", index=False)
+    save_to_catalog(df)
     logger.success("Scraping complete. Data saved to walmart_carry_on_luggage.csv")
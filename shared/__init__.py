@@ -0,0 +1 @@
+# code shared between the brand scrapers. brand scripts add the repo root to sys.path and import from here.
@@ -0,0 +1,73 @@
+import glob
+import json
+import os
+import timeit
+
+from bs4 import BeautifulSoup
+
+from shared.browser import has_captcha
+from shared.parsing import Page, available_backends
+
+# Compares the html parsing backends on the pages saved in the repo, and the old has_captcha (a full
+# html.parser DOM per page) against the substring pre-check. Run from the repo root:
+#   python -m shared.benchmark_parsing
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEAT = 5
+
+# (name, files, extractor) where the extractor does the real work the scrapers do on that kind of page
+FIXTURES = [
+    (
+        "samsonite listing grid (data-pids)",
+        ["Samsonite/samsonite_all_luggage.html"],
+        lambda page: [tile.attr("data-pid") for tile in page.select("div.product") if tile.attr("data-pid")],
+    ),
+    (
+        "samsonite quick view json (<pre>)",
+        sorted(glob.glob(os.path.join(REPO, "Samsonite/old_samsonite_stuff/*.html"))),
+        lambda page: json.loads(page.select_one("pre").text())["product"]["id"],
+    ),
+    (
+        "away pages (variant urls)",
+        sorted(glob.glob(os.path.join(REPO, "AwayTravel/ExampleHTMLS/*.html"))),
+        lambda page: {node.attr("data-product-url") for node in page.select("[data-product-url]")},
+    ),
+]
+
+
+def old_has_captcha(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    captcha_div = soup.find('div', class_='px-captcha-header')
+    return bool(captcha_div and "Before we continue..." in captcha_div.text)
+
+
+def best_of(function):
+    return min(timeit.repeat(function, number=1, repeat=REPEAT))
+
+
+def row(label, seconds, baseline):
+    print(f"  {label:<36}{seconds * 1000:10.2f} ms{baseline / seconds:9.1f}x")
+
+
+if __name__ == "__main__":
+    backends = available_backends()
+    for name, files, extract in FIXTURES:
+        pages = []
+        for path in files:
+            with open(os.path.join(REPO, path), 'r', encoding='utf-8') as f:
+                pages.append(f.read())
+        size = sum(len(page) for page in pages) / 1e6
+        print(f"{name}: {len(pages)} files, {size:.2f} MB")
+
+        expected = [extract(Page(page, "bs4")) for page in pages]
+        for backend in backends:
+            assert [extract(Page(page, backend)) for page in pages] == expected, backend
+
+        baseline = best_of(lambda: [extract(Page(page, "bs4")) for page in pages])
+        for backend in backends:
+            seconds = best_of(lambda: [extract(Page(page, backend)) for page in pages])
+            row(f"parse + extract ({backend})", seconds, baseline)
+
+        captcha_baseline = best_of(lambda: [old_has_captcha(page) for page in pages])
+        row("has_captcha (html.parser DOM)", captcha_baseline, captcha_baseline)
+        row("has_captcha (substring pre-check)", best_of(lambda: [has_captcha(page) for page in pages]), captcha_baseline)
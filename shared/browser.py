@@ -0,0 +1,112 @@
+import undetected_chromedriver as uc
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+from loguru import logger
+import threading
+import time
+
+from shared.parsing import parse
+
+
+DEFAULT_PAGE_TIMEOUT = 15   # seconds before we give up waiting and take the page as it is
+POLL_INTERVAL = 0.1         # seconds between readiness checks
+NETWORK_IDLE_SECONDS = 0.5  # no new network requests for this long counts as idle
+
+# wait strategies: each one is a js expression that is true once the page is usable.
+# every strategy also stops waiting as soon as a captcha shows up, has_captcha deals with it after
+CAPTCHA_CLASS = "px-captcha-header"
+CAPTCHA_TEXT = "Before we continue..."
+CAPTCHA_JS = f"!!document.querySelector('.{CAPTCHA_CLASS}')"
+READY_CONDITIONS = {
+    # Product-ShowQuickView and other json endpoints, which chrome renders inside a <pre>
+    "pre_json": "document.readyState !== 'loading' && !!document.querySelector('pre')",
+    # regular html pages
+    "ready_state": "document.readyState === 'complete'",
+}
+NETWORK_IDLE_JS = "return [document.readyState, performance.getEntriesByType('resource').length, " + CAPTCHA_JS + "]"
+
+CAPTCHA_SOLVE_SECONDS = 120  # how long a blocking caller gives the user to solve a captcha
+
+# strategy -> list of seconds each page took to become ready
+page_timings = {}
+page_timings_lock = threading.Lock()
+
+
+class CaptchaDetected(Exception):
+    def __init__(self, url):
+        super().__init__(f"Captcha detected on {url}")
+        self.url = url
+
+
+def setup_driver():
+    driver = uc.Chrome(headless=False, use_subprocess=False)
+    return driver
+
+def has_captcha(html):
+    # almost every page has no captcha, and a substring check is far cheaper than building a DOM
+    if CAPTCHA_CLASS not in html or CAPTCHA_TEXT not in html:
+        return False
+    captcha_div = parse(html).select_one(f'div.{CAPTCHA_CLASS}')
+    return captcha_div is not None and CAPTCHA_TEXT in captcha_div.text()
+
+def record_page_time(strategy, seconds):
+    with page_timings_lock:
+        page_timings.setdefault(strategy, []).append(seconds)
+
+def log_page_timings():
+    with page_timings_lock:
+        for strategy, timings in page_timings.items():
+            ordered = sorted(timings)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            logger.info(f"Page readiness ({strategy}): {len(ordered)} pages, avg {sum(ordered) / len(ordered):.2f}s, p95 {p95:.2f}s")
+
+def _wait_for_network_idle(driver, timeout):
+    deadline = time.monotonic() + timeout
+    last_count = -1
+    idle_since = time.monotonic()
+    while time.monotonic() < deadline:
+        ready_state, count, captcha = driver.execute_script(NETWORK_IDLE_JS)
+        if captcha:
+            return
+        now = time.monotonic()
+        if count != last_count:
+            last_count = count
+            idle_since = now
+        elif ready_state == "complete" and now - idle_since >= NETWORK_IDLE_SECONDS:
+            return
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutException(f"network did not go idle within {timeout}s")
+
+# waits until the current page is ready according to strategy and returns how long that took
+def wait_for_page(driver, strategy="ready_state", timeout=DEFAULT_PAGE_TIMEOUT):
+    start = time.monotonic()
+    try:
+        if strategy == "network_idle":
+            _wait_for_network_idle(driver, timeout)
+        else:
+            condition = f"return ({READY_CONDITIONS[strategy]}) || {CAPTCHA_JS}"
+            WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL).until(lambda d: d.execute_script(condition))
+    except TimeoutException:
+        logger.warning(f"Page not ready ({strategy}) after {timeout}s, using it as is")
+    elapsed = time.monotonic() - start
+    record_page_time(strategy, elapsed)
+    logger.debug(f"Page ready ({strategy}) in {elapsed:.2f}s")
+    return elapsed
+
+# raises CaptchaDetected straight away so the browser pool can back off that host and requeue the job.
+# callers outside the pool can pass captcha_wait to block and give the user time to solve it instead
+def fetch_html(driver, url, wait="ready_state", timeout=DEFAULT_PAGE_TIMEOUT, captcha_wait=0):
+    driver.get(url)
+    wait_for_page(driver, wait, timeout)
+    html = driver.page_source
+    # Check for captcha
+    if has_captcha(html):
+        if not captcha_wait:
+            raise CaptchaDetected(url)
+        logger.warning(f"Captcha detected. Waiting {captcha_wait} seconds for user to solve it...")
+        time.sleep(captcha_wait)
+        html = driver.page_source
+        if has_captcha(html):
+            logger.error("Captcha still present after waiting.")
+            raise CaptchaDetected(url)
+    return html
@@ -0,0 +1,301 @@
+from loguru import logger
+from urllib.parse import urlparse
+import asyncio
+import random
+import threading
+import time
+
+from shared.browser import setup_driver, CaptchaDetected
+
+
+# Pool of N browser instances that pull jobs from a shared queue.
+# Every driver.get goes through a per-host rate limiter, so adding workers never pushes more than the
+# configured request budget at one host. Drivers are started lazily, so a run that is served entirely
+# from local caches never opens a browser.
+
+# When a worker hits a captcha only that host is paused: the job goes back on the queue with exponential
+# backoff while workers keep taking jobs for other hosts. Challenge rates are tracked per host.
+
+DEFAULT_WORKERS = 3
+DEFAULT_REQUESTS_PER_SECOND = 0.5  # per host, shared by all workers
+BACKOFF_BASE_SECONDS = 60          # first pause after a captcha, doubled for every captcha in a row
+BACKOFF_MAX_SECONDS = 900
+BACKOFF_MAX_ATTEMPTS = 4           # captchas on the same job before it is given up on
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to each host so that all workers together stay under requests_per_second.
+    per_host overrides the budget for specific hosts, e.g. {"www.tumi.com": 0.2}.
+    """
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, per_host=None):
+        self.requests_per_second = requests_per_second
+        self.per_host = per_host or {}
+        self.next_slot = {}  # host -> earliest time the next request may start
+        self.paused_until = {}  # host -> end of its captcha pause
+        self.lock = threading.Lock()
+
+    def interval(self, host):
+        rate = self.per_host.get(host, self.requests_per_second)
+        return 1.0 / rate if rate else 0.0
+
+    # pushes every request to host back by at least seconds
+    def pause(self, host, seconds):
+        with self.lock:
+            resume = time.monotonic() + seconds
+            self.paused_until[host] = max(self.paused_until.get(host, resume), resume)
+            self.next_slot[host] = max(self.next_slot.get(host, resume), resume)
+
+    # seconds until host accepts requests again
+    def paused_for(self, host):
+        with self.lock:
+            return max(0.0, self.paused_until.get(host, 0.0) - time.monotonic())
+
+    # reserves the next free slot for host and returns how many seconds until it starts
+    def reserve(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval(host)
+        return slot - now
+
+    # blocks until this caller may send a request to host
+    def wait(self, host):
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+    # same as wait() for asyncio code, so http clients share the budget with the browsers
+    async def wait_async(self, host):
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CaptchaBackoff:
+    """
+    Per-host captcha bookkeeping: counts requests and challenges, and pauses a host in the rate limiter
+    for base_seconds * 2^(n-1) (plus jitter) after its n-th challenge in a row.
+    """
+
+    def __init__(self, rate_limiter, base_seconds=BACKOFF_BASE_SECONDS, max_seconds=BACKOFF_MAX_SECONDS):
+        self.rate_limiter = rate_limiter
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.requests = {}
+        self.challenges = {}
+        self.streak = {}
+        self.lock = threading.Lock()
+
+    def record_request(self, host):
+        with self.lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+
+    def record_success(self, host):
+        with self.lock:
+            self.streak[host] = 0
+
+    # returns how long the host is paused for
+    def record_challenge(self, host):
+        with self.lock:
+            self.challenges[host] = self.challenges.get(host, 0) + 1
+            self.streak[host] = self.streak.get(host, 0) + 1
+            delay = min(self.base_seconds * 2 ** (self.streak[host] - 1), self.max_seconds)
+        delay *= random.uniform(1.0, 1.25)
+        self.rate_limiter.pause(host, delay)
+        logger.warning(f"Captcha on {host} ({self.challenge_rate(host):.0%} of requests), pausing it for {delay:.0f}s")
+        return delay
+
+    def challenge_rate(self, host):
+        with self.lock:
+            requests = self.requests.get(host, 0)
+            return self.challenges.get(host, 0) / requests if requests else 0.0
+
+    def report(self):
+        for host in sorted(self.requests):
+            logger.info(f"{host}: {self.requests[host]} requests, {self.challenges.get(host, 0)} captchas ({self.challenge_rate(host):.1%})")
+
+
+class JobScheduler:
+    """
+    Job queue for the pool. Jobs can be requeued with a delay, and jobs for a paused host are skipped
+    until it resumes, so workers keep draining other hosts.
+    """
+
+    def __init__(self, jobs, host_of, rate_limiter):
+        self.host_of = host_of
+        self.rate_limiter = rate_limiter
+        self.pending = [(0.0, job, 0) for job in jobs]  # (not before, job, captcha attempts)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+    def _ready_in(self, entry, now):
+        not_before, job, _ = entry
+        host = self.host_of(job)
+        paused = self.rate_limiter.paused_for(host) if host else 0.0
+        return max(not_before - now, paused)
+
+    # returns (job, attempts), or None once there is nothing left to do
+    def get(self):
+        with self.condition:
+            while True:
+                if not self.pending and self.in_flight == 0:
+                    return None
+                now = time.monotonic()
+                soonest = None
+                for i, entry in enumerate(self.pending):
+                    ready_in = self._ready_in(entry, now)
+                    if ready_in <= 0:
+                        del self.pending[i]
+                        self.in_flight += 1
+                        return entry[1], entry[2]
+                    soonest = ready_in if soonest is None else min(soonest, ready_in)
+                # nothing runnable yet: sleep until the soonest job is due or another worker requeues something
+                self.condition.wait(timeout=soonest)
+
+    def done(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def requeue(self, job, attempts, delay):
+        with self.condition:
+            self.pending.append((time.monotonic() + delay, job, attempts))
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+class PooledDriver:
+    """
+    Stands in for a uc.Chrome instance: starts the browser on first use, rate limits get()
+    and counts the pages it loaded. Everything else is passed through to the real driver.
+    """
+
+    def __init__(self, worker_id, rate_limiter, backoff, driver_factory=setup_driver):
+        self.worker_id = worker_id
+        self.rate_limiter = rate_limiter
+        self.backoff = backoff
+        self.driver_factory = driver_factory
+        self.driver = None
+        self.pages = 0
+        self.busy_seconds = 0.0
+
+    def _ensure_driver(self):
+        if self.driver is None:
+            logger.info(f"Starting browser for worker {self.worker_id}")
+            self.driver = self.driver_factory()
+        return self.driver
+
+    def get(self, url):
+        driver = self._ensure_driver()
+        host = urlparse(url).netloc
+        self.rate_limiter.wait(host)
+        self.backoff.record_request(host)
+        start = time.monotonic()
+        driver.get(url)
+        self.busy_seconds += time.monotonic() - start
+        self.pages += 1
+
+    def __getattr__(self, name):
+        return getattr(self._ensure_driver(), name)
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logger.warning(f"Failed to quit browser for worker {self.worker_id}: {str(e)}")
+            self.driver = None
+
+
+class BrowserPool:
+    def __init__(self, workers=DEFAULT_WORKERS, rate_limiter=None, driver_factory=setup_driver, max_attempts=BACKOFF_MAX_ATTEMPTS):
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.backoff = CaptchaBackoff(self.rate_limiter)
+        self.max_attempts = max_attempts
+        self.drivers = [PooledDriver(i, self.rate_limiter, self.backoff, driver_factory) for i in range(workers)]
+        self.result_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _worker(self, driver, scheduler, handler, on_result, failures):
+        while True:
+            next_job = scheduler.get()
+            if next_job is None:
+                return
+            job, attempts = next_job
+            try:
+                result = handler(driver, job)
+            except CaptchaDetected as e:
+                host = urlparse(e.url).netloc
+                delay = self.backoff.record_challenge(host)
+                if attempts + 1 < self.max_attempts:
+                    logger.info(f"Worker {driver.worker_id} requeued {job} to retry in {delay:.0f}s")
+                    scheduler.requeue(job, attempts + 1, delay)
+                else:
+                    logger.error(f"Giving up on {job} after {attempts + 1} captchas")
+                    with self.result_lock:
+                        failures.append(job)
+                    scheduler.done()
+                continue
+            except Exception as e:
+                logger.error(f"Worker {driver.worker_id} failed on {job}: {str(e)}")
+                with self.result_lock:
+                    failures.append(job)
+                scheduler.done()
+                continue
+            host = scheduler.host_of(job)
+            if host:
+                self.backoff.record_success(host)
+            if on_result is not None:
+                # callbacks are serialized so they can append to shared files without their own locking
+                with self.result_lock:
+                    on_result(job, result)
+            scheduler.done()
+
+    # runs handler(driver, job) for every job across the pool, calling on_result(job, result) as each one finishes.
+    # host_of(job) tells the scheduler which host a job will hit so it can skip jobs for paused hosts.
+    # returns the jobs that failed
+    def map(self, handler, jobs, on_result=None, host_of=lambda job: None):
+        scheduler = JobScheduler(jobs, host_of, self.rate_limiter)
+        total = len(scheduler)
+        pages_before = [driver.pages for driver in self.drivers]
+        failures = []
+
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=self._worker, args=(driver, scheduler, handler, on_result, failures), daemon=True)
+            for driver in self.drivers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        self.report(elapsed, pages_before)
+        self.backoff.report()
+        logger.info(f"Finished {total - len(failures)}/{total} jobs in {elapsed:.1f}s")
+        return failures
+
+    def report(self, elapsed, pages_before=None):
+        stats = []
+        for i, driver in enumerate(self.drivers):
+            pages = driver.pages - (pages_before[i] if pages_before else 0)
+            rate = pages / elapsed if elapsed > 0 else 0.0
+            stats.append({"worker": driver.worker_id, "pages": pages, "pages_per_second": rate})
+            logger.info(f"Worker {driver.worker_id}: {pages} pages, {rate:.2f} pages/s")
+        return stats
+
+    def close(self):
+        for driver in self.drivers:
+            driver.quit()
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+from shared.dimensions import normalize_frame, structured_frame, NUMERIC_COLUMNS, CONFIDENCE_COLUMN
+
+
+# Typed, columnar output for the scraped catalog.
+# Rows are buffered and written one row group at a time to <name>.parquet (or an Arrow IPC <name>.arrow),
+# with the numeric dimension/weight columns from shared/dimensions.py filled in per row group, so
+# downstream analysis can memory-map the file instead of re-parsing csv text. When the writer is closed
+# the same table is exported as <name>.csv, properly quoted, as a secondary view. Given a CatalogStore
+# (shared/catalog_db.py) each row group is also upserted into the SQLite catalog in one transaction.
+#
+#   with open_catalog("Samsonite_Raw", "samsonite_data") as catalog:
+#       catalog.write(("Samsonite", name, color, dimensions, weight), key=color_id)
+
+ROW_GROUP_SIZE = 500  # buffered rows per row group
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# the text columns every scraper emits, in csv order, with their csv headers
+TEXT_COLUMNS = {
+    "brand": "Brand",
+    "product_name": "Product Name",
+    "color": "Color",
+    "dimensions": "Dimensions",
+    "weight": "Weight",
+}
+SCHEMA = pa.schema(
+    [(column, pa.string()) for column in TEXT_COLUMNS]
+    + [(column, pa.float64()) for column in NUMERIC_COLUMNS]
+    + [
+        (CONFIDENCE_COLUMN, pa.string()),
+        ("key", pa.string()),  # what the scraper keys the record by: color id, product url, ...
+        ("fetched_at", pa.timestamp("s", tz="UTC")),
+    ]
+)
+
+
+class CatalogWriter:
+    def __init__(self, path, format="parquet", row_group_size=ROW_GROUP_SIZE, csv_path=None, store=None, retailer=None):
+        self.path = path
+        self.format = format
+        self.row_group_size = row_group_size
+        self.csv_path = csv_path if csv_path is not None else os.path.splitext(path)[0] + ".csv"
+        self.store = store
+        self.retailer = retailer
+        self.buffer = []      # (row, key, structured, fetched_at, variant)
+        self.rows_written = 0
+        self.writer = None
+        self.lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # row is (brand, product name, color, dimensions, weight). structured is an optional dict of
+    # height/length/width/uom/weight/weight_uom (e.g. dimensions.demandware_units) that wins over the text.
+    # variant holds what only the sqlite store keeps: product_key, url, image_urls and raw
+    def write(self, row, key=None, structured=None, **variant):
+        with self.lock:
+            self.buffer.append((list(row), key, structured, int(time.time()), variant))
+            if len(self.buffer) >= self.row_group_size:
+                self._write_row_group()
+
+    def _open(self):
+        if self.format == "arrow":
+            return pa.ipc.new_file(self.path, SCHEMA)
+        return pq.ParquetWriter(self.path, SCHEMA, compression="zstd")
+
+    def _write_row_group(self):
+        if not self.buffer:
+            return
+        rows, keys, structured, fetched_at, variants = zip(*self.buffer)
+        df = pd.DataFrame(rows, columns=list(TEXT_COLUMNS))
+        # one vectorized normalization pass per row group
+        if any(s is not None for s in structured):
+            structured = structured_frame(structured, index=df.index)
+        else:
+            structured = None
+        df = normalize_frame(df, dimension_column="dimensions", weight_column="weight", structured=structured)
+        df["key"] = [None if key is None else str(key) for key in keys]
+        df["fetched_at"] = pd.to_datetime(list(fetched_at), unit="s", utc=True)
+        table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+        if self.writer is None:
+            self.writer = self._open()
+        self.writer.write_table(table)
+        if self.store is not None:
+            self._upsert(df, variants)
+        self.rows_written += len(self.buffer)
+        logger.debug(f"Wrote a row group of {len(self.buffer)} rows to {self.path}")
+        self.buffer = []
+
+    def _upsert(self, df, variants):
+        records = []
+        for (_, row), variant in zip(df.iterrows(), variants):
+            if row["key"] is None:
+                continue
+            records.append({
+                "product_name": row["product_name"],
+                "variant_key": row["key"],
+                "color": row["color"],
+                "dimensions": row["dimensions"],
+                "weight": row["weight"],
+                "numeric": {column: None if pd.isna(row[column]) else float(row[column]) for column in NUMERIC_COLUMNS},
+                **variant,
+            })
+        self.store.upsert_variants(self.retailer or df["brand"].iloc[0], records)
+
+    def flush(self):
+        with self.lock:
+            self._write_row_group()
+
+    # writes the last row group, closes the file and exports the csv view
+    def close(self):
+        with self.lock:
+            self._write_row_group()
+            if self.writer is None:
+                # nothing was written, still leave an empty (but valid) file behind
+                self.writer = self._open()
+            self.writer.close()
+        export_csv(self.path, self.csv_path)
+        logger.info(f"Saved {self.rows_written} rows to {self.path} and {self.csv_path}")
+
+
+def read_catalog(path):
+    if path.endswith(FORMATS["arrow"]):
+        # zero-copy, the table keeps the map open for as long as it is referenced
+        return pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return pq.read_table(path, memory_map=True)
+
+# the csv view keeps the original scraper headers for the text columns
+def export_csv(path, csv_path):
+    df = read_catalog(path).to_pandas()
+    df = df.rename(columns=TEXT_COLUMNS)
+    df.to_csv(csv_path, index=False)
+    return csv_path
+
+# a writer for the first unused <name>.<ext> / <name>(1).<ext> / ... in folder, like the scrapers' csvs
+def open_catalog(folder, name, format="parquet", row_group_size=ROW_GROUP_SIZE, store=None, retailer=None):
+    extension = FORMATS[format]
+    stem = os.path.join(folder, name)
+    counter = 1
+    while os.path.exists(stem + extension) or os.path.exists(stem + ".csv"):
+        stem = os.path.join(folder, f"{name}({counter})")
+        counter += 1
+    logger.info(f"Created new catalog: {stem + extension}")
+    return CatalogWriter(stem + extension, format, row_group_size, store=store, retailer=retailer)
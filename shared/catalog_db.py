@@ -0,0 +1,219 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+
+
+# One embedded SQLite catalog for every retailer, next to the brand folders (catalog.db at the repo root).
+# Retailers, products, variants (one row per color), their images and the raw payloads they came from live
+# in indexed tables, so "have we already scraped this color?" is an index lookup instead of a directory scan,
+# and brands can be joined and compared with plain SQL:
+#
+#   sqlite3 catalog.db "select r.name, p.name, v.color, v.height_in from variants v
+#                       join products p on p.id = v.product_id join retailers r on r.id = v.retailer_id"
+#
+# The database runs in WAL mode and every thread gets its own connection, so pool workers can read
+# while the persist thread writes. Writes are upserts keyed on (retailer, variant key).
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "catalog.db")
+BUSY_TIMEOUT_MS = 30000
+
+SCHEMA = """
+create table if not exists retailers (
+    id integer primary key,
+    name text not null unique,
+    host text
+);
+create table if not exists products (
+    id integer primary key,
+    retailer_id integer not null references retailers(id),
+    product_key text not null,
+    name text,
+    updated_at real,
+    unique (retailer_id, product_key)
+);
+create table if not exists variants (
+    id integer primary key,
+    retailer_id integer not null references retailers(id),
+    product_id integer references products(id),
+    variant_key text not null,
+    color text,
+    dimensions text,
+    weight text,
+    height_in real,
+    length_in real,
+    width_in real,
+    weight_lb real,
+    url text,
+    fetched_at real,
+    unique (retailer_id, variant_key)
+);
+create index if not exists variants_product on variants(product_id);
+create index if not exists products_name on products(name);
+create table if not exists images (
+    variant_id integer not null references variants(id) on delete cascade,
+    position integer not null,
+    url text not null,
+    primary key (variant_id, position)
+);
+create index if not exists images_url on images(url);
+create table if not exists raw_payloads (
+    variant_id integer primary key references variants(id) on delete cascade,
+    payload text not null,
+    fetched_at real
+);
+"""
+
+
+class CatalogStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.retailer_ids = {}
+        self.lock = threading.Lock()
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    # one connection per thread, sqlite connections must not be shared between threads
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)
+            connection.row_factory = sqlite3.Row
+            connection.execute("pragma journal_mode=wal")
+            connection.execute("pragma synchronous=normal")
+            connection.execute(f"pragma busy_timeout={BUSY_TIMEOUT_MS}")
+            connection.execute("pragma foreign_keys=on")
+            self.local.connection = connection
+        return connection
+
+    def retailer_id(self, name, host=None):
+        with self.lock:
+            if name in self.retailer_ids:
+                return self.retailer_ids[name]
+        with self.connection() as connection:
+            connection.execute(
+                "insert into retailers (name, host) values (?, ?) "
+                "on conflict (name) do update set host = coalesce(excluded.host, retailers.host)",
+                (name, host),
+            )
+            retailer_id = connection.execute("select id from retailers where name = ?", (name,)).fetchone()[0]
+        with self.lock:
+            self.retailer_ids[name] = retailer_id
+        return retailer_id
+
+    # inserts or updates one variant (color) with its product, images and raw payload. numeric is an optional
+    # dict with height_in/length_in/width_in/weight_lb. returns the variant id
+    def upsert_variant(self, retailer, product_key, product_name, variant_key, color=None, dimensions=None, weight=None,
+                       numeric=None, url=None, image_urls=None, raw=None, host=None):
+        record = {
+            "product_key": product_key, "product_name": product_name, "variant_key": variant_key,
+            "color": color, "dimensions": dimensions, "weight": weight, "numeric": numeric,
+            "url": url, "image_urls": image_urls, "raw": raw,
+        }
+        return self.upsert_variants(retailer, [record], host)[0]
+
+    # upserts many variant records (dicts with upsert_variant's keyword names) in a single transaction
+    def upsert_variants(self, retailer, records, host=None):
+        retailer_id = self.retailer_id(retailer, host)
+        now = time.time()
+        with self.connection() as connection:
+            return [self._upsert(connection, retailer_id, record, now) for record in records]
+
+    def _upsert(self, connection, retailer_id, record, now):
+        product_key = str(record.get("product_key") or record.get("product_name"))
+        variant_key = str(record["variant_key"])
+        numeric = record.get("numeric") or {}
+        connection.execute(
+            "insert into products (retailer_id, product_key, name, updated_at) values (?, ?, ?, ?) "
+            "on conflict (retailer_id, product_key) do update set name = excluded.name, updated_at = excluded.updated_at",
+            (retailer_id, product_key, record.get("product_name"), now),
+        )
+        product_id = connection.execute(
+            "select id from products where retailer_id = ? and product_key = ?", (retailer_id, product_key)
+        ).fetchone()[0]
+        connection.execute(
+            "insert into variants (retailer_id, product_id, variant_key, color, dimensions, weight, "
+            "height_in, length_in, width_in, weight_lb, url, fetched_at) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "on conflict (retailer_id, variant_key) do update set product_id = excluded.product_id, "
+            "color = excluded.color, dimensions = excluded.dimensions, weight = excluded.weight, "
+            "height_in = excluded.height_in, length_in = excluded.length_in, width_in = excluded.width_in, "
+            "weight_lb = excluded.weight_lb, url = coalesce(excluded.url, variants.url), fetched_at = excluded.fetched_at",
+            (
+                retailer_id, product_id, variant_key, record.get("color"), record.get("dimensions"), record.get("weight"),
+                numeric.get("height_in"), numeric.get("length_in"), numeric.get("width_in"), numeric.get("weight_lb"),
+                record.get("url"), now,
+            ),
+        )
+        variant_id = connection.execute(
+            "select id from variants where retailer_id = ? and variant_key = ?", (retailer_id, variant_key)
+        ).fetchone()[0]
+        if record.get("image_urls") is not None:
+            connection.execute("delete from images where variant_id = ?", (variant_id,))
+            connection.executemany(
+                "insert into images (variant_id, position, url) values (?, ?, ?)",
+                [(variant_id, position, image_url) for position, image_url in enumerate(record["image_urls"])],
+            )
+        if record.get("raw") is not None:
+            connection.execute(
+                "insert into raw_payloads (variant_id, payload, fetched_at) values (?, ?, ?) "
+                "on conflict (variant_id) do update set payload = excluded.payload, fetched_at = excluded.fetched_at",
+                (variant_id, json.dumps(record["raw"], ensure_ascii=False), now),
+            )
+        return variant_id
+
+    # True if the variant is in the catalog (and, with max_age_seconds, was fetched that recently)
+    def has_variant(self, retailer, variant_key, max_age_seconds=None):
+        row = self.connection().execute(
+            "select v.fetched_at from variants v join retailers r on r.id = v.retailer_id "
+            "where r.name = ? and v.variant_key = ?",
+            (retailer, str(variant_key)),
+        ).fetchone()
+        if row is None:
+            return False
+        return max_age_seconds is None or time.time() - row["fetched_at"] < max_age_seconds
+
+    def variant_keys(self, retailer):
+        rows = self.connection().execute(
+            "select v.variant_key from variants v join retailers r on r.id = v.retailer_id where r.name = ?", (retailer,)
+        )
+        return {row[0] for row in rows}
+
+    # the stored raw payload for a variant, or None
+    def raw_payload(self, retailer, variant_key):
+        row = self.connection().execute(
+            "select p.payload from raw_payloads p join variants v on v.id = p.variant_id "
+            "join retailers r on r.id = v.retailer_id where r.name = ? and v.variant_key = ?",
+            (retailer, str(variant_key)),
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def image_urls(self, retailer, variant_key):
+        rows = self.connection().execute(
+            "select i.url from images i join variants v on v.id = i.variant_id "
+            "join retailers r on r.id = v.retailer_id where r.name = ? and v.variant_key = ? order by i.position",
+            (retailer, str(variant_key)),
+        )
+        return [row[0] for row in rows]
+
+    # closes this thread's connection; the others are closed when their threads are collected
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+# one store per database file, shared by every thread
+def for_path(path=DEFAULT_PATH):
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = CatalogStore(path)
+            logger.info(f"Opened catalog database {path}")
+        return _stores[path]
@@ -0,0 +1,109 @@
+from loguru import logger
+import os
+import csv
+import json
+import hashlib
+import threading
+import time
+
+
+# Fingerprints for incremental (delta) crawls.
+# Each product/color record is stored with a hash of its normalized fields and the time it was fetched.
+# A run only refetches records that are new or older than the TTL, then writes a delta csv
+# (added/changed/removed) and rewrites the rolling <name>_current.csv snapshot of the whole catalog.
+
+DEFAULT_TTL_HOURS = 24 * 7
+FINGERPRINT_FILE = "fingerprints.json"
+
+
+def fingerprint(fields):
+    normalized = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class FingerprintStore:
+    def __init__(self, folder, ttl_hours=DEFAULT_TTL_HOURS):
+        self.folder = folder
+        self.path = os.path.join(folder, FINGERPRINT_FILE)
+        self.ttl_seconds = ttl_hours * 3600
+        self.records = {}  # key -> {"fingerprint", "fetched_at", "row"}
+        self.seen = set()  # keys that are still in the catalog this run
+        self.changes = []  # (change, key, row)
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.records = json.load(f)
+            logger.info(f"Loaded {len(self.records)} fingerprints from {self.path}")
+
+    # True if key was fetched within the TTL. fresh keys count as seen, so they stay in the snapshot
+    def is_fresh(self, key):
+        with self.lock:
+            record = self.records.get(key)
+            fresh = record is not None and time.time() - record["fetched_at"] < self.ttl_seconds
+            if fresh:
+                self.seen.add(key)
+            return fresh
+
+    # splits the keys listed in the catalog into (keys to fetch, fresh keys that can be skipped).
+    # every listed key counts as seen, so a stale record that fails to refetch is kept rather than removed
+    def partition(self, keys):
+        stale, fresh = [], []
+        for key in keys:
+            (fresh if self.is_fresh(key) else stale).append(key)
+        with self.lock:
+            self.seen.update(keys)
+        logger.info(f"Incremental run: {len(stale)} new or stale records to fetch, {len(fresh)} still fresh")
+        return stale, fresh
+
+    # records a freshly fetched row, returns "added", "changed" or "unchanged".
+    # extra is hashed along with the row (e.g. image urls) but not written to the csvs
+    def update(self, key, row, extra=None):
+        digest = fingerprint([list(row), extra])
+        with self.lock:
+            previous = self.records.get(key)
+            if previous is None:
+                change = "added"
+            elif previous["fingerprint"] != digest:
+                change = "changed"
+            else:
+                change = "unchanged"
+            self.records[key] = {"fingerprint": digest, "fetched_at": time.time(), "row": list(row)}
+            self.seen.add(key)
+            if change != "unchanged":
+                self.changes.append((change, key, list(row)))
+        return change
+
+    # writes <name>_delta_<timestamp>.csv and <name>_current.csv, then saves the fingerprints.
+    # only pass detect_removed=True when this run listed the whole catalog
+    def finish(self, name, headers, detect_removed=True):
+        with self.lock:
+            if detect_removed:
+                for key in sorted(set(self.records) - self.seen):
+                    self.changes.append(("removed", key, self.records.pop(key)["row"]))
+            os.makedirs(self.folder, exist_ok=True)
+
+            delta_path = os.path.join(self.folder, f"{name}_delta_{time.strftime('%Y%m%d-%H%M%S')}.csv")
+            with open(delta_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(["Change", "Key"] + list(headers))
+                for change, key, row in self.changes:
+                    writer.writerow([change, key] + row)
+
+            current_path = os.path.join(self.folder, f"{name}_current.csv")
+            tmp_path = current_path + ".tmp"
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(list(headers))
+                for key in sorted(self.records):
+                    writer.writerow(self.records[key]["row"])
+            os.replace(tmp_path, current_path)
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.records, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+            counts = {change: sum(1 for c in self.changes if c[0] == change) for change in ("added", "changed", "removed")}
+        logger.info(f"Delta: {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed -> {delta_path}")
+        logger.info(f"Rolling snapshot of {len(self.records)} records written to {current_path}")
+        return counts
@@ -0,0 +1,559 @@
+from loguru import logger
+import os
+import json
+import re
+import queue
+import threading
+
+from shared.parsing import parse, pre_text
+from shared.browser import fetch_html, log_page_timings, CaptchaDetected, DEFAULT_PAGE_TIMEOUT, CAPTCHA_SOLVE_SECONDS
+from shared.browser_pool import BrowserPool, HostRateLimiter, DEFAULT_WORKERS, DEFAULT_REQUESTS_PER_SECOND
+from shared.http_session import export_session, fetch_json_with_session, DEFAULT_CONCURRENCY, DEFAULT_HTTP_REQUESTS_PER_SECOND
+from shared.delta import FingerprintStore, DEFAULT_TTL_HOURS
+from shared.dimensions import demandware_units
+from shared.catalog import open_catalog
+from shared import raw_index, image_manifest, catalog_db
+
+
+# Engine for the Salesforce Commerce Cloud (Demandware) storefronts run by the Samsonite group.
+# Samsonite and American Tourister (and the other group brands) share the exact same infrastructure,
+# so each brand script only describes its site and calls run().
+
+# NOTE ABOUT IDS:
+# the product id is expressed as 117224XXXX where the last 4 digits differentiate colors
+# so really the color id is a product id, but specifies which color of a product as well
+
+# TODOLIST:
+# - more elegent dimension/weight formatting -> numeric columns in the catalog, see shared/catalog.py
+# - image download functionality -> done, see shared/image_downloader.py
+# - undetectable driver? https://github.com/UltrafunkAmsterdam/undetected-chromedriver
+
+CSV_HEADERS = ['Brand', 'Product Name', 'Color', 'Dimensions', 'Weight']
+DEFAULT_GRID_PAGE_SIZE = 60
+GRID_TOTAL_PATTERN = re.compile(r'result-count[^>]*>[^0-9<]*(?:<[^>]+>[^0-9<]*)*([\d,]+)\s+Results', re.IGNORECASE)
+# image types that are not pictures of the product itself
+EXCLUDED_IMAGE_TYPES = ["pdp-background", "stacked-highlight", "video-thumbnail"]
+
+
+class DemandwareSite:
+    """
+    Everything that differs between two Demandware storefronts.
+    All paths are relative to the brand folder the script is run from.
+    """
+
+    def __init__(self, brand, host, site_id, category_ids, file_prefix, raw_data_folder, csv_name, locale="en_US",
+                 grid_page_size=DEFAULT_GRID_PAGE_SIZE, workers=DEFAULT_WORKERS, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, page_timeout=DEFAULT_PAGE_TIMEOUT,
+                 http_mode=True, http_concurrency=DEFAULT_CONCURRENCY, http_requests_per_second=DEFAULT_HTTP_REQUESTS_PER_SECOND, ttl_hours=DEFAULT_TTL_HOURS, expand_colors=True):
+        self.brand = brand                      # e.g. "Samsonite"
+        self.host = host                        # e.g. "shop.samsonite.com"
+        self.site_id = site_id                  # e.g. "samsonite" for Sites-samsonite-Site
+        self.category_ids = list(category_ids)  # cgids of the categories to crawl, e.g. ["luggage-carry-on", "wheeled-duffels"]
+        self.file_prefix = file_prefix          # prefix for every file the scraper writes
+        self.raw_data_folder = raw_data_folder
+        self.csv_name = csv_name                # base name of the numbered output catalog (.parquet + .csv)
+        self.locale = locale
+        self.grid_page_size = grid_page_size    # products asked for per Search-UpdateGrid request (sz), the server may return fewer
+        self.workers = workers                  # number of browsers in the pool
+        self.requests_per_second = requests_per_second  # request budget for this host across all browsers
+        self.page_timeout = page_timeout        # max seconds to wait for a page to become ready
+        self.http_mode = http_mode              # fetch quick view json over http with the browser's cookies
+        self.http_concurrency = http_concurrency
+        self.http_requests_per_second = http_requests_per_second  # request budget for this host over http, apart from the browsers'
+        self.ttl_hours = ttl_hours              # incremental runs refetch colors older than this
+        self.expand_colors = expand_colors      # build each product's default color from its base quick view json
+
+    @property
+    def base_url(self):
+        return f"https://{self.host}/"
+
+    @property
+    def controller_url(self):
+        return f"https://{self.host}/on/demandware.store/Sites-{self.site_id}-Site/{self.locale}/"
+
+    @property
+    def quick_view_base_url(self):
+        return self.controller_url + "Product-ShowQuickView?pid="
+
+    def grid_url(self, category_id, start):
+        return self.controller_url + f"Search-UpdateGrid?cgid={category_id}&start={start}&sz={self.grid_page_size}"
+
+    @property
+    def product_ids_path(self):
+        return os.path.join(self.raw_data_folder, "product_ids.json")
+
+    def quick_view_url(self, pid, color_id=None):
+        url = self.quick_view_base_url + pid
+        if color_id:
+            url += f"&dwvar_{pid}_color={color_id}"
+        return url
+
+
+def sanitize_filename(filename):
+    # Replace invalid characters with underscores
+    invalid_chars = r'[<>:"/\\|?*]'
+    sanitized = re.sub(invalid_chars, '_', filename)
+    # Remove any leading/trailing spaces and dots
+    sanitized = sanitized.strip('. ')
+    return sanitized
+
+# returns (data-pids on the page, total hit count or None) for one Search-UpdateGrid page
+def parse_grid_page(html):
+    pids = [tile.attr('data-pid') for tile in parse(html).select('div.product') if tile.attr('data-pid')]
+    # the full search page shows "<n> Results", the UpdateGrid fragment usually has no count at all
+    match = GRID_TOTAL_PATTERN.search(html)
+    total = int(match.group(1).replace(",", "")) if match else None
+    return pids, total
+
+def fetch_grid_page(site, driver, category_id, start):
+    url = site.grid_url(category_id, start)
+    logger.info(f"Loading product grid from {url}")
+    return parse_grid_page(fetch_html(driver, url, "ready_state", site.page_timeout))
+
+# fetches grid pages (cgid, start) across the pool, returns {(cgid, start): pids}.
+# pages that could not be loaded are added to failures
+def fetch_grid_pages(site, pool, pages, totals=None, failures=None):
+    results = {}
+
+    def collect(page, result):
+        pids, total = result
+        results[page] = pids
+        if totals is not None and total:
+            totals[page[0]] = total
+
+    failed = pool.map(lambda driver, page: fetch_grid_page(site, driver, *page), pages, on_result=collect, host_of=lambda page: site.host)
+    for page in failed:
+        logger.error(f"Could not load grid page {page}")
+    if failures is not None:
+        failures.extend(failed)
+    return results
+
+# enumerates every category in site.category_ids in parallel. the server can cap sz below grid_page_size, so
+# pages are stepped by how many pids the first page actually returned. when the grid shows a total, all the
+# remaining pages are fetched at once; categories without a total are paged a wave of pool-size pages at a
+# time until a page adds no new pids
+def discover_product_ids(site, pool, failures=None):
+    totals = {}
+    pages = fetch_grid_pages(site, pool, [(category_id, 0) for category_id in site.category_ids], totals, failures)
+
+    steps = {}
+    remaining = []
+    unknown = []
+    for category_id in site.category_ids:
+        step = len(pages.get((category_id, 0), []))
+        if not step:
+            continue
+        steps[category_id] = step
+        if category_id in totals:
+            remaining += [(category_id, start) for start in range(step, totals[category_id], step)]
+        else:
+            unknown.append(category_id)
+    pages.update(fetch_grid_pages(site, pool, remaining, failures=failures))
+
+    seen = {category_id: set(pages.get((category_id, 0), [])) for category_id in unknown}
+    next_start = {category_id: steps[category_id] for category_id in unknown}
+    while unknown:
+        wave = [(category_id, next_start[category_id] + i * steps[category_id]) for category_id in unknown for i in range(site.workers)]
+        results = fetch_grid_pages(site, pool, wave, failures=failures)
+        pages.update(results)
+        for category_id in list(unknown):
+            starts = [next_start[category_id] + i * steps[category_id] for i in range(site.workers)]
+            done = False
+            for start in starts:
+                new_pids = set(results.get((category_id, start), [])) - seen[category_id]
+                seen[category_id] |= new_pids
+                done = done or not new_pids
+            if done:
+                unknown.remove(category_id)
+            else:
+                next_start[category_id] += site.workers * steps[category_id]
+
+    product_ids = {}
+    for category_id in site.category_ids:
+        starts = sorted(start for cgid, start in pages if cgid == category_id)
+        product_ids[category_id] = list(dict.fromkeys(pid for start in starts for pid in pages[(category_id, start)]))
+        logger.info(f"Found {len(product_ids[category_id])} product IDs in {category_id}")
+    return product_ids
+
+# returns the data-pids of every product in site.category_ids, de-duplicated across categories.
+# grid pages that failed are added to failures, and a list with gaps is never cached
+def get_product_ids(site, pool, failures=None):
+    refetch = 'y' if not os.path.exists(site.product_ids_path) else input("Would you like to refetch product IDs? (y/n)")
+    if refetch == "y":
+        failed = []
+        product_ids = discover_product_ids(site, pool, failed)
+        if failed:
+            logger.warning(f"{len(failed)} grid pages failed, not caching the incomplete product IDs")
+        else:
+            with open(site.product_ids_path, 'w', encoding='utf-8') as f:
+                json.dump(product_ids, f, indent=2)
+            logger.info(f"Product IDs saved to {site.product_ids_path}")
+        if failures is not None:
+            failures.extend(failed)
+    else:
+        logger.info("Loading from cached file")
+        with open(site.product_ids_path, 'r', encoding='utf-8') as f:
+            product_ids = json.load(f)
+
+    # a product listed in several categories is only scraped once
+    unique_ids = list(dict.fromkeys(pid for category_ids in product_ids.values() for pid in category_ids))
+    logger.info(f"Found {len(unique_ids)} product IDs across {len(product_ids)} categories")
+    return unique_ids
+
+# returns a dictionary with product name as the key and a dictionary of color names to color ids as the values
+def get_product_color_ids(site, driver, pid):
+    url = site.quick_view_url(pid)
+    logger.info(f"Loading product details from {url}")
+    html = fetch_html(driver, url, "pre_json", site.page_timeout)
+    pre = pre_text(html) # note can't use a simple cloudscraper or requests get because it tends to set off the bot detector more
+    if pre:
+        try:
+            return parse_base_payload(site, json.loads(pre))
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse JSON for product {pid}: {str(e)}")
+    return None
+
+def base_payload_path(site, product_name):
+    return os.path.join(site.raw_data_folder, "Base_Details", f'{site.file_prefix}_product_details_{sanitize_filename(product_name)}.json')
+
+# saves the base quick view json of a product and returns {product name: {color name: color id}}
+def parse_base_payload(site, product_data):
+    product_name = product_data["product"]["productName"]
+
+    # Create the directory if it doesn't exist
+    json_path = base_payload_path(site, product_name)
+    os.makedirs(os.path.dirname(json_path), exist_ok=True)
+
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(product_data, f, indent=2)
+    logger.info(f"Saved base product details raw data for {product_name}")
+
+    # get the color ids
+    color_mapping = {}
+    variationAttributes = product_data["product"]["variationAttributes"]
+    for attribute in variationAttributes:
+        if attribute["attributeId"] == "color":
+            colors = attribute["values"]
+            logger.info(f"Found {len(colors)} color IDs for {product_name}")
+            for color in colors:
+                color_id = color["value"]
+                color_name = color["displayValue"]
+                color_mapping[color_name] = color_id
+                logger.info(f"Color ID: {color_id}, Color Name: {color_name}")
+
+    return {product_name: color_mapping}
+
+# COLOR EXPANSION: the base quick view json already is the full record of the product's default color.
+# name, dimensions and weight are shared by every color (true for all 178 colors saved in the raw folders),
+# but the gallery is not: the color values in variationAttributes only carry swatch chips. so the default
+# color is built from the base payload with no request at all, and the other colors still need their own
+# quick view for their images. returns {color id: "product" payload}
+def expand_base_payload(base_product):
+    derived = {}
+    for attribute in base_product.get("variationAttributes", []):
+        if attribute["attributeId"] != "color":
+            continue
+        for color in attribute["values"]:
+            if color["value"] == base_product.get("id") or color.get("selected"):
+                product_data = dict(base_product, id=color["value"])
+                product_data["variationAttributes"] = [
+                    dict(a, displayValue=color["displayValue"]) if a["attributeId"] == "color" else a
+                    for a in base_product["variationAttributes"]
+                ]
+                derived[color["value"]] = product_data
+    return derived
+
+def load_base_payload(site, product_name):
+    json_path = base_payload_path(site, product_name)
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("product")
+
+# {color id: payload} for every color in color_ids whose whole record is in its product's base payload
+def derive_colors_from_base(site, product_colors, color_ids):
+    wanted = set(color_ids)
+    derived = {}
+    for product_name in product_colors:
+        base_product = load_base_payload(site, product_name)
+        if base_product is None:
+            continue
+        try:
+            derived.update({c: data for c, data in expand_base_payload(base_product).items() if c in wanted})
+        except KeyError as e:
+            logger.error(f"Unexpected base payload for {product_name}, missing {str(e)}")
+    logger.info(f"Built {len(derived)} colors from their base payloads, {len(wanted) - len(derived)} still need their own quick view")
+    return derived
+
+# HTTP MODE: the quick view endpoints return plain json, so once the browser has a session we can skip rendering.
+# returns ({job: quick view json}, [jobs the browser still has to fetch])
+def fetch_quick_views_over_http(site, get_session, jobs, url_for_job, rate_limiter):
+    if not jobs:
+        return {}, []
+    session = get_session()
+    if session is None:
+        return {}, list(jobs)
+    urls = {url_for_job(job): job for job in jobs}
+    try:
+        results, needs_browser = fetch_json_with_session(session, list(urls), site.base_url, site.http_concurrency, rate_limiter)
+    except Exception as e:
+        logger.error(f"HTTP mode failed, falling back to the browser: {str(e)}")
+        return {}, list(jobs)
+    return {urls[url]: data for url, data in results.items()}, [urls[url] for url in needs_browser]
+
+# returns a function that opens the storefront in the browser and exports its cookies for the http client.
+# the browser is only started the first time a run actually has something to fetch
+def lazy_http_session(site, driver):
+    session = {}
+
+    def get_session():
+        if "value" not in session:
+            session["value"] = None
+            if site.http_mode:
+                try:
+                    fetch_html(driver, site.base_url, "ready_state", site.page_timeout, CAPTCHA_SOLVE_SECONDS)
+                    session["value"] = export_session(driver)
+                except Exception as e:
+                    logger.error(f"Could not establish a browser session for HTTP mode: {str(e)}")
+        return session["value"]
+
+    return get_session
+
+def image_manifest_path(site):
+    return os.path.join(site.raw_data_folder, "image_urls.json")
+
+def append_to_image_urls(site, images, brand, name, color):
+    # buffered append to the image url log, folded into image_urls.json at the end of the run
+    image_manifest.for_path(image_manifest_path(site)).add((brand, name, color), images)
+    logger.info(f"Appended {len(images)} image URLs under {brand} -> {name} -> {color}")
+
+def color_quick_view_url(site):
+    return lambda color_id: site.quick_view_url(color_id[:-4] + "XXXX", color_id)
+
+# FETCH: returns the raw "product" payload for one color, from the raw data folder if we already have it
+def fetch_color_payload(site, driver, color_id, use_cache=True):
+    url = color_quick_view_url(site)(color_id)
+    logger.info(f"Loading product details from {url}")
+    product_data = None
+    if use_cache:
+        # indexed lookup in the sqlite catalog, then the raw index for colors scraped before it existed
+        product_data = catalog_db.for_path().raw_payload(site.brand, color_id)
+        if product_data is None:
+            product_data = raw_index.for_folder(site.raw_data_folder).load(color_id)
+    if product_data is not None:
+        logger.info(f"JSON file for color ID {color_id} already exists. Loading from file.")
+        return product_data
+
+    try:
+        html = fetch_html(driver, url, "pre_json", site.page_timeout)
+    except CaptchaDetected:
+        # the pool pauses the host and requeues this color
+        raise
+    except Exception as e:
+        logger.error(f"Skipping color {color_id}: {str(e)}")
+        return None
+
+    pre = pre_text(html)
+    if pre is None:
+        # an error page or a soft block instead of the quick view json
+        logger.error(f"Skipping color {color_id}: no JSON on {url}")
+        return None
+    try:
+        return json.loads(pre)["product"]
+    except (json.JSONDecodeError, KeyError) as e:
+        logger.error(f"Skipping color {color_id}: unexpected JSON on {url} ({str(e)})")
+        return None
+
+# PARSE: returns (product brand, product name, product color, product dimensions, product weight) and the image urls
+def parse_color_payload(site, product_data):
+    product_name = product_data["productName"]
+    product_color = None
+    for attribute in product_data["variationAttributes"]:
+        if attribute["attributeId"] == "color":
+            product_color = attribute["displayValue"]
+
+    product_dimensions = product_data["product-dimensions"]
+    product_weight = str(product_data["unit-weight"]) + " " + product_data["unit-weight-type"]
+
+    # Get all image URLs except for background, highlight, and thumbnail images
+    image_urls = [
+        image["url"]
+        for image_type, images in product_data["images"].items()
+        if image_type not in EXCLUDED_IMAGE_TYPES
+        for image in images
+    ]
+    return (site.brand, product_name, product_color, product_dimensions, product_weight), image_urls
+
+# PERSIST: writes the image urls and the raw payload for one color
+def persist_color_payload(site, color_id, product_data, details, image_urls):
+    product_brand, product_name, product_color = details[:3]
+    append_to_image_urls(site, image_urls, product_brand, product_name, product_color)
+    # Create the directory structure for saving the product data
+    product_folder = os.path.join(site.raw_data_folder, sanitize_filename(product_name), sanitize_filename(product_color))
+    os.makedirs(product_folder, exist_ok=True)
+
+    # Save the product data as a JSON file
+    json_file_path = os.path.join(product_folder, f"{site.file_prefix}_{color_id}_{sanitize_filename(product_name)}_{sanitize_filename(product_color)}_raw.json")
+    try:
+        with open(json_file_path, 'w', encoding='utf-8') as f:
+            json.dump(product_data, f, indent=2)
+        raw_index.for_folder(site.raw_data_folder).add(color_id, json_file_path)
+        logger.info(f"Saved product data to {json_file_path}")
+    except Exception as e:
+        logger.error(f"Failed to save product data to {json_file_path}: {str(e)}")
+
+# returns (product brand, product name, product color, product dimensions, product weight)
+def get_product_color_details(site, driver, color_id):
+    product_data = fetch_color_payload(site, driver, color_id)
+    if product_data is None:
+        return None
+    details, image_urls = parse_color_payload(site, product_data)
+    persist_color_payload(site, color_id, product_data, details, image_urls)
+    return details
+
+# products whose color ids could not be fetched are added to failures. they are also saved next to the
+# (partial) mappings, so a later run that loads them from disk still knows they are incomplete
+def load_product_colors(site, pool, pids, get_session=lambda: None, failures=None, http_rate_limiter=None):
+    colors_path = os.path.join(site.raw_data_folder, 'product_colors.json')
+    failed_path = os.path.join(site.raw_data_folder, 'product_colors_failed.json')
+    failures = failures if failures is not None else []
+    refetch = 'y' if not os.path.exists(colors_path) else input("Would you like to refetch product color IDs? (y/n): ")
+
+    if refetch.lower() != 'y':
+        logger.info("Loading existing color mappings")
+        if os.path.exists(failed_path):
+            with open(failed_path, 'r', encoding='utf-8') as f:
+                failures.extend(json.load(f))
+            logger.warning(f"The saved color mappings are missing products, see {failed_path}")
+        with open(colors_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    product_colors = {}
+    failed = []
+
+    def collect(pid, result):
+        if result:
+            product_colors.update(result)
+        else:
+            failed.append(pid)
+
+    try:
+        payloads, browser_pids = fetch_quick_views_over_http(site, get_session, pids, site.quick_view_url, http_rate_limiter or HostRateLimiter(site.http_requests_per_second))
+        for pid, product_data in payloads.items():
+            try:
+                collect(pid, parse_base_payload(site, product_data))
+            except KeyError as e:
+                logger.error(f"Unexpected quick view JSON for product {pid}, missing {str(e)}")
+                browser_pids.append(pid)
+        failed += pool.map(lambda driver, pid: get_product_color_ids(site, driver, pid), browser_pids, on_result=collect, host_of=lambda pid: site.host)
+    except Exception as e:
+        logger.error(f"An error occurred while fetching product color IDs: {str(e)}")
+        failed.append(f"error: {str(e)}")
+    finally:
+        # save whatever we got so a crash halfway through the catalog doesn't lose the mappings
+        with open(colors_path, 'w', encoding='utf-8') as f:
+            json.dump(product_colors, f, indent=2)
+        if failed:
+            with open(failed_path, 'w', encoding='utf-8') as f:
+                json.dump(failed, f, indent=2)
+        elif os.path.exists(failed_path):
+            os.remove(failed_path)
+        logger.info(f"Saved color mappings for {len(product_colors)} products ({len(failed)} failed)")
+    failures.extend(failed)
+    return product_colors
+
+# parse/persist stage of the pipeline. runs on its own thread so the browser never waits on disk writes
+def persist_worker(site, jobs, catalog, product_of, fingerprints=None):
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        color_id, product_data = job
+        try:
+            details, image_urls = parse_color_payload(site, product_data)
+            persist_color_payload(site, color_id, product_data, details, image_urls)
+            # the unit-* fields give exact numeric dimensions, the text is only parsed where they are missing
+            catalog.write(
+                details,
+                key=color_id,
+                structured=demandware_units(product_data),
+                product_key=product_of.get(color_id),
+                image_urls=image_urls,
+                raw=product_data,
+            )
+            if fingerprints is not None:
+                fingerprints.update(color_id, details, image_urls)
+            logger.info(f"Appended details for {details[1]} - {details[2]} to the catalog")
+        except Exception as e:
+            logger.error(f"Failed to parse/persist color {color_id}: {str(e)}")
+
+def run(site, incremental=None):
+    # Create the main raw data folder if it doesn't exist
+    os.makedirs(site.raw_data_folder, exist_ok=True)
+    store = catalog_db.for_path()
+    catalog = open_catalog(site.raw_data_folder, site.csv_name, store=store, retailer=site.brand)
+    if incremental is None:
+        incremental = input("Would you like to run incrementally (only refetch new or stale colors)? (y/n): ").strip().lower() == 'y'
+    # incremental runs refetch stale colors from the site instead of trusting the raw data folder
+    fingerprints = FingerprintStore(site.raw_data_folder, site.ttl_hours) if incremental else None
+
+    rate_limiter = HostRateLimiter(site.requests_per_second)
+    # the http client has its own budget, so json requests don't queue behind the browsers' page loads
+    http_rate_limiter = HostRateLimiter(site.http_requests_per_second)
+    with BrowserPool(site.workers, rate_limiter) as pool:
+        # anything that failed while listing the catalog, so missing colors aren't taken as removed
+        discovery_failures = []
+        pids = get_product_ids(site, pool, discovery_failures)
+        get_session = lazy_http_session(site, pool.drivers[0])
+        product_colors = load_product_colors(site, pool, pids, get_session, discovery_failures, http_rate_limiter)
+        if discovery_failures:
+            logger.warning(f"Catalog listing had {len(discovery_failures)} failures, colors missing from it won't be reported as removed")
+
+        # the browsers fetch on the pool threads while the persist thread parses and writes behind them
+        jobs = queue.Queue(maxsize=32)
+        product_of = {color_id: pid for pid, color_mapping in product_colors.items() for color_id in color_mapping.values()}
+        persister = threading.Thread(target=persist_worker, args=(site, jobs, catalog, product_of, fingerprints), daemon=True)
+        persister.start()
+        color_ids = list(product_of)
+
+        def enqueue(color_id, product_data):
+            if product_data:  # Only persist if we got valid details
+                jobs.put((color_id, product_data))
+
+        try:
+            if fingerprints is not None:
+                color_ids, _ = fingerprints.partition(color_ids)
+            if site.expand_colors:
+                derived = derive_colors_from_base(site, product_colors, color_ids)
+                for color_id, product_data in derived.items():
+                    enqueue(color_id, product_data)
+                color_ids = [color_id for color_id in color_ids if color_id not in derived]
+            if fingerprints is not None:
+                missing = color_ids
+            else:
+                index = raw_index.for_folder(site.raw_data_folder)
+                stored = store.variant_keys(site.brand)
+                missing = [color_id for color_id in color_ids if color_id not in stored and index.lookup(color_id) is None]
+            payloads, browser_color_ids = fetch_quick_views_over_http(site, get_session, missing, color_quick_view_url(site), http_rate_limiter)
+            for color_id, product_data in payloads.items():
+                if "product" in product_data:
+                    enqueue(color_id, product_data["product"])
+                else:
+                    browser_color_ids.append(color_id)
+            # cached colors are read from disk by the pool, only the http fallbacks open a page
+            missing = set(missing)
+            cached = [color_id for color_id in color_ids if color_id not in missing]
+            pool.map(
+                lambda driver, color_id: fetch_color_payload(site, driver, color_id, use_cache=fingerprints is None),
+                cached + browser_color_ids,
+                on_result=enqueue,
+                host_of=lambda color_id: site.host,
+            )
+        finally:
+            jobs.put(None)
+            persister.join()
+            catalog.close()
+            raw_index.for_folder(site.raw_data_folder).flush(force=True)
+            image_manifest.for_path(image_manifest_path(site)).close()
+            if fingerprints is not None:
+                fingerprints.finish(site.csv_name, CSV_HEADERS, detect_removed=not discovery_failures)
+            log_page_timings()
@@ -0,0 +1,189 @@
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+
+# Turns the free-text dimension and weight strings every brand emits into numbers.
+# Canonical units are inches and pounds. Whole columns are parsed in one vectorized pass with
+# pandas .str.extract, so tens of thousands of rows take well under a second.
+#
+# parse_confidence per row:
+#   structured - taken from Demandware's unit-height/unit-length/unit-width fields
+#   labeled    - all three numbers came with H/L/W(/D) labels, e.g. 21in H x 14.5in L x 8in W
+#   ordered    - three unlabeled numbers, read as H x L x W, e.g. 21.7" x 14.4" x 9"
+#   none       - no dimensions found
+#
+# usage: python -m shared.dimensions <csv> [<csv> ...] writes <name>_normalized.csv next to each csv
+
+NUMERIC_COLUMNS = ["height_in", "length_in", "width_in", "weight_lb"]
+CONFIDENCE_COLUMN = "parse_confidence"
+
+_NUMBER = r'(\d+(?:\.\d+)?)'
+_LENGTH_UNIT = r'\s*(inches|inch|in\.?|"|cm|mm)?'
+_LABEL = r'\s*([HLWD])?\b'
+_SEPARATOR = r'\s*[x×]\s*'
+_PART = _NUMBER + _LENGTH_UNIT + _LABEL
+DIMENSIONS_PATTERN = re.compile(_PART + _SEPARATOR + _PART + _SEPARATOR + _PART + _LENGTH_UNIT, re.IGNORECASE)
+WEIGHT_PATTERN = re.compile(_NUMBER + r'\s*(lbs?|pounds?|kgs?|kilograms?|oz|ounces?|g|grams?)\b', re.IGNORECASE)
+
+TO_INCHES = {"in": 1.0, "cm": 1 / 2.54, "mm": 1 / 25.4}
+TO_POUNDS = {"lb": 1.0, "kg": 2.20462, "oz": 1 / 16, "g": 0.00220462}
+# D (depth) is the third, smallest side. Brands that use it write H x W x D, where W is our length
+AXIS_FOR_LABEL = {"H": "height_in", "L": "length_in", "W": "width_in", "D": "width_in"}
+AXIS_FOR_LABEL_WITH_DEPTH = {"H": "height_in", "W": "length_in", "D": "width_in", "L": "length_in"}
+
+
+def _clean(texts):
+    return (
+        texts.astype("string")
+        .fillna("")
+        .str.replace("\xa0", " ", regex=False)
+        .str.replace("″", '"', regex=False)
+        .str.replace("''", '"', regex=False)
+    )
+
+def _length_unit(units):
+    units = units.fillna("").str.lower().str.rstrip(".")
+    unit = pd.Series("in", index=units.index)
+    unit[units == "cm"] = "cm"
+    unit[units == "mm"] = "mm"
+    return unit.map(TO_INCHES)
+
+def _weight_unit(units):
+    units = units.fillna("").str.lower()
+    factor = pd.Series(np.nan, index=units.index)
+    factor[units.str.startswith("lb") | units.str.startswith("pound")] = TO_POUNDS["lb"]
+    factor[units.str.startswith("k")] = TO_POUNDS["kg"]
+    factor[units.str.startswith("o")] = TO_POUNDS["oz"]
+    factor[units.str.match(r'^g(ram)?s?$')] = TO_POUNDS["g"]
+    return factor
+
+# returns a frame of height_in/length_in/width_in/parse_confidence for a column of dimension strings
+def parse_dimensions(texts):
+    texts = _clean(pd.Series(texts))
+    parts = texts.str.extract(DIMENSIONS_PATTERN)
+    numbers = [parts[i].astype(float) for i in (0, 3, 6)]
+    labels = [parts[i].str.upper() for i in (2, 5, 8)]
+    # a unit on any side (or after the last one) applies to all three, e.g. 20 x 14 x 9 cm
+    unit = parts[1].fillna(parts[4]).fillna(parts[7]).fillna(parts[9])
+    factor = _length_unit(unit)
+
+    labeled = labels[0].notna() & labels[1].notna() & labels[2].notna()
+    has_depth = (labels[0] == "D") | (labels[1] == "D") | (labels[2] == "D")
+    axes = [label.map(AXIS_FOR_LABEL).where(~has_depth, label.map(AXIS_FOR_LABEL_WITH_DEPTH)) for label in labels]
+    out = pd.DataFrame(index=texts.index)
+    for position, column in enumerate(["height_in", "length_in", "width_in"]):
+        # unlabeled: take the numbers in H x L x W order
+        value = numbers[position].copy()
+        labeled_value = pd.Series(np.nan, index=texts.index)
+        for number, axis in zip(numbers, axes):
+            labeled_value = labeled_value.fillna(number.where(axis == column))
+        value[labeled] = labeled_value[labeled]
+        out[column] = (value * factor).round(2)
+
+    found = numbers[0].notna()
+    out[CONFIDENCE_COLUMN] = np.select([found & labeled, found], ["labeled", "ordered"], default="none")
+    return out
+
+# returns a series of weights in pounds for a column of weight strings
+def parse_weights(texts):
+    texts = _clean(pd.Series(texts))
+    parts = texts.str.extract(WEIGHT_PATTERN)
+    return (parts[0].astype(float) * _weight_unit(parts[1])).round(2).rename("weight_lb")
+
+# adds the numeric columns to df, parsed from its dimension and weight text columns.
+# structured is an optional frame (same index) with height/length/width/weight/uom/weight_uom
+# columns, e.g. from Demandware's unit-* fields; rows that have them are taken as is
+def normalize_frame(df, dimension_column="Dimensions", weight_column="Weight", structured=None):
+    out = df.copy()
+    if dimension_column in df:
+        dimensions = parse_dimensions(df[dimension_column])
+    else:
+        dimensions = pd.DataFrame({"height_in": np.nan, "length_in": np.nan, "width_in": np.nan, CONFIDENCE_COLUMN: "none"}, index=df.index)
+    for column in ["height_in", "length_in", "width_in", CONFIDENCE_COLUMN]:
+        out[column] = dimensions[column]
+    out["weight_lb"] = parse_weights(df[weight_column]) if weight_column in df else np.nan
+
+    if structured is not None:
+        factor = _length_unit(structured["uom"].astype("string"))
+        has_structured = structured[["height", "length", "width"]].notna().all(axis=1)
+        for axis in ["height", "length", "width"]:
+            out.loc[has_structured, f"{axis}_in"] = (structured.loc[has_structured, axis].astype(float) * factor[has_structured]).round(2)
+        out.loc[has_structured, CONFIDENCE_COLUMN] = "structured"
+        weight_factor = _weight_unit(structured["weight_uom"].astype("string"))
+        has_weight = structured["weight"].notna() & weight_factor.notna()
+        out.loc[has_weight, "weight_lb"] = (structured.loc[has_weight, "weight"].astype(float) * weight_factor[has_weight]).round(2)
+    return out
+
+# the structured fields of one Demandware "product" payload
+def demandware_units(payload):
+    return {
+        "height": payload.get("unit-height"),
+        "length": payload.get("unit-length"),
+        "width": payload.get("unit-width"),
+        "uom": payload.get("unit-uom", "in"),
+        "weight": payload.get("unit-weight"),
+        "weight_uom": payload.get("unit-weight-type"),
+    }
+
+# UN/CEFACT unit codes schema.org QuantitativeValues use, mapped to the units normalize_frame knows
+SCHEMA_ORG_UNITS = {"INH": "in", "CMT": "cm", "MMT": "mm", "LBR": "lb", "KGM": "kg", "GRM": "g", "ONZ": "oz"}
+
+# (number, unit) of a QuantitativeValue, a bare number or a numeric string. number is None for anything else
+def schema_org_quantity(value):
+    unit = None
+    if isinstance(value, dict):
+        unit = value.get("unitCode") or value.get("unitText")
+        unit = SCHEMA_ORG_UNITS.get(unit, unit)
+        value = value.get("value")
+    try:
+        return float(value), unit
+    except (TypeError, ValueError):
+        return None, unit
+
+# the structured fields of a schema.org Product (JSON-LD). its height x width x depth is our height x length x width
+def schema_org_units(product):
+    height, uom = schema_org_quantity(product.get("height"))
+    length, _ = schema_org_quantity(product.get("width"))
+    width, _ = schema_org_quantity(product.get("depth"))
+    weight, weight_uom = schema_org_quantity(product.get("weight"))
+    return {
+        "height": height,
+        "length": length,
+        "width": width,
+        "uom": uom or "in",
+        "weight": weight,
+        "weight_uom": weight_uom,
+    }
+
+# the structured frame for normalize_frame from a list of Demandware "product" payloads
+def demandware_structured(payloads, index=None):
+    return structured_frame([demandware_units(p) for p in payloads], index=index)
+
+# the structured frame for normalize_frame from a list of dicts (None for rows without structured fields)
+def structured_frame(rows, index=None):
+    columns = ["height", "length", "width", "uom", "weight", "weight_uom"]
+    return pd.DataFrame([row or {} for row in rows], columns=columns, index=index)
+
+def normalize_csv(csv_path):
+    df = pd.read_csv(csv_path, skipinitialspace=True)
+    # Away's csv header has a stray space
+    df.columns = [column.strip() for column in df.columns]
+    out = normalize_frame(df)
+    out_path = os.path.splitext(csv_path)[0] + "_normalized.csv"
+    out.to_csv(out_path, index=False)
+    counts = out[CONFIDENCE_COLUMN].value_counts().to_dict()
+    logger.info(f"Normalized {len(out)} rows from {csv_path} -> {out_path} {counts}")
+    return out_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add numeric height/length/width (in) and weight (lb) columns to scraper csvs")
+    parser.add_argument("csvs", nargs="+")
+    args = parser.parse_args()
+    for path in args.csvs:
+        normalize_csv(path)
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import httpx
+from loguru import logger
+from urllib.parse import urlparse
+
+
+# Hands a browser session over to a pooled httpx client.
+# The browser gets past the bot detection once, then its cookies and user agent are copied into an
+# httpx.AsyncClient that fetches json endpoints directly and concurrently. Any response that looks like a
+# challenge page is reported back so the caller can retry that url in the browser.
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_HTTP_REQUESTS_PER_SECOND = 4.0  # per host for json requests, separate from the browsers' page budget
+HTTP_TIMEOUT = 30.0
+CHALLENGE_MARKERS = ("px-captcha", "_pxAppId", "Before we continue...")
+
+
+class ChallengeDetected(Exception):
+    pass
+
+
+# snapshot of everything the http client needs from the browser. plain data, so it can be reused by
+# clients created later in other event loops
+def export_session(driver):
+    return {
+        "user_agent": driver.execute_script("return navigator.userAgent"),
+        "cookies": driver.get_cookies(),
+    }
+
+def client_from_session(session, referer=None, concurrency=DEFAULT_CONCURRENCY):
+    cookies = httpx.Cookies()
+    for cookie in session["cookies"]:
+        cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+    headers = {
+        "User-Agent": session["user_agent"],
+        "Accept": "application/json,text/javascript,*/*;q=0.01",
+        "Accept-Language": "en-US,en;q=0.9",
+        "X-Requested-With": "XMLHttpRequest",
+    }
+    if referer:
+        headers["Referer"] = referer
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    logger.info(f"Handing off {len(session['cookies'])} browser cookies to the http client")
+    return httpx.AsyncClient(http2=True, cookies=cookies, headers=headers, limits=limits, timeout=HTTP_TIMEOUT, follow_redirects=True)
+
+def is_challenge(response):
+    if response.status_code in (403, 429):
+        return True
+    if "json" in response.headers.get("content-type", ""):
+        return False
+    return any(marker in response.text for marker in CHALLENGE_MARKERS)
+
+async def fetch_json(client, url, rate_limiter=None):
+    if rate_limiter is not None:
+        await rate_limiter.wait_async(urlparse(url).netloc)
+    response = await client.get(url)
+    if is_challenge(response):
+        raise ChallengeDetected(f"Challenge page for {url} (status {response.status_code})")
+    response.raise_for_status()
+    return json.loads(response.content)
+
+# fetches every url concurrently and returns ({url: json}, [urls that need the browser]).
+# after the first challenge no new requests are sent over http, the rest is left for the browser
+async def fetch_json_many(client, urls, concurrency=DEFAULT_CONCURRENCY, rate_limiter=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    needs_browser = []
+    challenged = asyncio.Event()
+
+    async def fetch_one(url):
+        async with semaphore:
+            if challenged.is_set():
+                needs_browser.append(url)
+                return
+            try:
+                results[url] = await fetch_json(client, url, rate_limiter)
+            except ChallengeDetected as e:
+                logger.warning(f"{str(e)}, falling back to the browser")
+                challenged.set()
+                needs_browser.append(url)
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
+                logger.error(f"HTTP fetch failed for {url}: {str(e)}")
+                needs_browser.append(url)
+
+    await asyncio.gather(*(fetch_one(url) for url in urls))
+    logger.info(f"Fetched {len(results)}/{len(urls)} json documents over http, {len(needs_browser)} left for the browser")
+    return results, needs_browser
+
+# sync entry point: one pooled client for the whole batch of urls
+def fetch_json_with_session(session, urls, referer=None, concurrency=DEFAULT_CONCURRENCY, rate_limiter=None):
+    async def fetch_all():
+        async with client_from_session(session, referer, concurrency) as client:
+            return await fetch_json_many(client, urls, concurrency, rate_limiter)
+
+    return asyncio.run(fetch_all())
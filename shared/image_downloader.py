@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import mimetypes
+import os
+import time
+from urllib.parse import urlparse
+
+import httpx
+from loguru import logger
+
+from shared.image_manifest import read_manifest
+from shared.image_urls import normalize_urls
+
+
+# Downloads the images listed in the scrapers' manifests into a content-addressed store.
+# Every file is saved as <out>/sha256/<first 2 hex chars>/<sha256>.<ext>, so an image shared by several
+# colors or brands is only stored once. download_state.json maps each url to its hash, which lets an
+# interrupted run pick up where it stopped, and unfinished downloads resume from their .part file.
+#
+# usage (from the repo root):
+#   python -m shared.image_downloader Samsonite/Samsonite_Raw/image_urls.json Walmart/walmart_carry_on_luggage.csv
+
+DEFAULT_OUTPUT_FOLDER = "Images"
+STATE_FILE = "download_state.json"
+TOTAL_CONCURRENCY = 32
+PER_HOST_CONCURRENCY = 6
+SAVE_STATE_EVERY = 50   # downloads between saves of the state file
+MAX_ATTEMPTS = 3
+CHUNK_SIZE = 1 << 16
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/113.0.0.0 Safari/537.36"
+    ),
+    "Accept": "image/avif,image/webp,image/*,*/*;q=0.8",
+}
+
+
+def _flatten(node, path, out):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            _flatten(value, path + [key], out)
+    elif isinstance(node, list):
+        for url in node:
+            if url:
+                out.append((path, url))
+
+# returns [(path, url)] from an image_urls.json / images.json manifest (plus its append log if there is one)
+def urls_from_manifest(json_path):
+    out = []
+    _flatten(read_manifest(json_path), [], out)
+    return out
+
+# returns [(path, url)] from a csv with an Image_URL column, like the walmart output
+def urls_from_csv(csv_path, url_column="Image_URL", name_column="Title"):
+    out = []
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get(url_column):
+                out.append(([row.get(name_column, "")], row[url_column]))
+    return out
+
+def urls_from_path(path):
+    if path.endswith(".csv"):
+        return urls_from_csv(path)
+    return urls_from_manifest(path)
+
+def extension_for(content_type, url):
+    extension = mimetypes.guess_extension((content_type or "").split(";")[0].strip())
+    if extension in (None, ".jpe"):
+        extension = os.path.splitext(urlparse(url).path)[1] or ".jpg"
+    return extension
+
+# client errors other than 429 (a 404, a 403 from the CDN...) won't change on a retry
+def is_retryable(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or not 400 <= status < 500
+    return True
+
+
+class ImageDownloader:
+    def __init__(self, output_folder=DEFAULT_OUTPUT_FOLDER, total_concurrency=TOTAL_CONCURRENCY, per_host_concurrency=PER_HOST_CONCURRENCY):
+        self.output_folder = output_folder
+        self.part_folder = os.path.join(output_folder, "partial")
+        self.state_path = os.path.join(output_folder, STATE_FILE)
+        self.total_concurrency = total_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.host_semaphores = {}
+        self.state = {}  # url -> {"sha256", "path", "bytes"}
+        self.unsaved = 0
+        self.stats = {"downloaded": 0, "skipped": 0, "deduplicated": 0, "failed": 0, "bytes": 0}
+        os.makedirs(self.part_folder, exist_ok=True)
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+            logger.info(f"Resuming with {len(self.state)} images already downloaded")
+
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+        self.unsaved = 0
+
+    def host_semaphore(self, url):
+        host = urlparse(url).netloc
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self.host_semaphores[host]
+
+    def part_path(self, url):
+        return os.path.join(self.part_folder, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+
+    async def _download_to_part(self, client, url):
+        part_path = self.part_path(url)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 416:
+                # the part file already holds the whole image. this response's content type is for its error
+                # body, not the image, so the extension comes from the url
+                return part_path, None
+            response.raise_for_status()
+            # servers that ignore Range send the whole file again
+            mode = 'ab' if offset and response.status_code == 206 else 'wb'
+            with open(part_path, mode) as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    f.write(chunk)
+            return part_path, response.headers.get("content-type")
+
+    def _store(self, url, part_path, content_type):
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        relative_path = os.path.join("sha256", sha256[:2], sha256 + extension_for(content_type, url))
+        final_path = os.path.join(self.output_folder, relative_path)
+        size = os.path.getsize(part_path)
+        if os.path.exists(final_path):
+            os.remove(part_path)
+            self.stats["deduplicated"] += 1
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(part_path, final_path)
+            self.stats["bytes"] += size
+        self.state[url] = {"sha256": sha256, "path": relative_path, "bytes": size}
+        self.unsaved += 1
+        if self.unsaved >= SAVE_STATE_EVERY:
+            self.save_state()
+
+    async def download(self, client, global_semaphore, url):
+        if url in self.state:
+            if os.path.exists(os.path.join(self.output_folder, self.state[url]["path"])):
+                self.stats["skipped"] += 1
+                return
+            # the stored file was deleted or moved, download it again
+            del self.state[url]
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            # the host slot comes first, so tasks queued behind a busy host don't hold global slots other hosts could use
+            async with self.host_semaphore(url), global_semaphore:
+                try:
+                    part_path, content_type = await self._download_to_part(client, url)
+                    self._store(url, part_path, content_type)
+                    self.stats["downloaded"] += 1
+                    return
+                except httpx.HTTPError as e:
+                    logger.warning(f"Attempt {attempt} failed for {url}: {str(e)}")
+                    if not is_retryable(e):
+                        break
+            # back off without holding any slot
+            if attempt < MAX_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
+        self.stats["failed"] += 1
+        logger.error(f"Giving up on {url}")
+
+    async def download_all(self, urls):
+        # ask every CDN for the configured resolution, and fetch each asset once whatever size it was listed at
+        urls = normalize_urls(urls)
+        start = time.monotonic()
+        limits = httpx.Limits(max_connections=self.total_concurrency, max_keepalive_connections=self.total_concurrency)
+        global_semaphore = asyncio.Semaphore(self.total_concurrency)
+        try:
+            async with httpx.AsyncClient(http2=True, headers=HEADERS, limits=limits, timeout=60.0, follow_redirects=True) as client:
+                await asyncio.gather(*(self.download(client, global_semaphore, url) for url in urls))
+        finally:
+            self.save_state()
+        elapsed = time.monotonic() - start
+        logger.info(
+            f"{self.stats['downloaded']} downloaded ({self.stats['bytes'] / 1e6:.1f} MB new, {self.stats['deduplicated']} duplicates), "
+            f"{self.stats['skipped']} already done, {self.stats['failed']} failed in {elapsed:.1f}s"
+        )
+        return self.stats
+
+
+def download_manifests(paths, output_folder=DEFAULT_OUTPUT_FOLDER, total_concurrency=TOTAL_CONCURRENCY, per_host_concurrency=PER_HOST_CONCURRENCY):
+    urls = []
+    for path in paths:
+        entries = urls_from_path(path)
+        logger.info(f"Read {len(entries)} image urls from {path}")
+        urls.extend(url for _, url in entries)
+    downloader = ImageDownloader(output_folder, total_concurrency, per_host_concurrency)
+    return asyncio.run(downloader.download_all(urls))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download every image in the given manifests into a content-addressed store")
+    parser.add_argument("manifests", nargs="+", help="image_urls.json / images.json manifests or csvs with an Image_URL column")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT_FOLDER, help="output folder")
+    parser.add_argument("--concurrency", type=int, default=TOTAL_CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=PER_HOST_CONCURRENCY)
+    args = parser.parse_args()
+    download_manifests(args.manifests, args.out, args.concurrency, args.per_host)
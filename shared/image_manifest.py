@@ -0,0 +1,117 @@
+from loguru import logger
+import os
+import json
+import threading
+
+from shared.image_urls import normalize_urls
+
+
+# Append-only store for the image url manifests (image_urls.json).
+# Instead of loading, mutating and re-dumping the whole json file for every color, new urls are appended
+# as one json line each to <name>.log.jsonl in batches. compact() folds the log into the json snapshot,
+# and read_manifest() returns the same nested view (e.g. brand -> name -> color -> [urls]) from both.
+
+FLUSH_EVERY = 20  # buffered entries between writes to the log
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def log_path_for(json_path):
+    return os.path.splitext(json_path)[0] + ".log.jsonl"
+
+def apply_entry(data, path, urls, replace=False):
+    node = data
+    for key in path[:-1]:
+        node = node.setdefault(key, {})
+    if replace:
+        existing = []
+    else:
+        existing = node.get(path[-1], [])
+    # resize every url to IMAGE_CONFIG and remove duplicates (the same asset at any size) while preserving order
+    node[path[-1]] = normalize_urls(existing + list(urls))
+
+# returns the nested dict stored in json_path with every logged entry applied on top
+def read_manifest(json_path):
+    data = {}
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    log_path = log_path_for(json_path)
+    if os.path.exists(log_path):
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a run that was killed mid-write can leave half a line at the end
+                    logger.warning(f"Skipping truncated line in {log_path}")
+                    continue
+                apply_entry(data, entry["path"], entry["urls"], entry.get("replace", False))
+    return data
+
+
+class ImageManifest:
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.log_path = log_path_for(json_path)
+        self.buffer = []
+        self.lock = threading.Lock()
+
+    # path is the list of keys leading to the url list, e.g. (brand, name, color).
+    # replace=True overwrites the urls stored at that path instead of extending them
+    def add(self, path, urls, replace=False):
+        with self.lock:
+            self.buffer.append({"path": list(path), "urls": list(urls), "replace": replace})
+            should_flush = len(self.buffer) >= FLUSH_EVERY
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.buffer)
+            folder = os.path.dirname(self.log_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+            logger.debug(f"Flushed {len(self.buffer)} image manifest entries to {self.log_path}")
+            self.buffer = []
+
+    def read(self):
+        self.flush()
+        with self.lock:
+            return read_manifest(self.json_path)
+
+    # folds the log into the json snapshot and truncates the log
+    def compact(self):
+        self.flush()
+        with self.lock:
+            data = read_manifest(self.json_path)
+            tmp_path = self.json_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.json_path)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+        logger.info(f"Compacted image manifest into {self.json_path}")
+        return data
+
+    def close(self, compact=True):
+        if compact:
+            self.compact()
+        else:
+            self.flush()
+
+
+# one manifest per json file, shared by every thread that appends to it
+def for_path(json_path):
+    with _manifests_lock:
+        if json_path not in _manifests:
+            _manifests[json_path] = ImageManifest(json_path)
+        return _manifests[json_path]
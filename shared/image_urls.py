@@ -0,0 +1,92 @@
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+
+# Per-CDN image url rewriting.
+# canonical_url() strips every resize/format parameter, so the same asset requested at different sizes
+# compares equal. sized_url() asks the CDN for exactly the resolution and format in IMAGE_CONFIG, so we
+# neither download oversized originals nor end up with 180px thumbnails.
+
+# the one place to change what the computer vision pipeline gets
+IMAGE_CONFIG = {
+    "width": 1024,
+    "height": 1024,
+    "format": "jpg",   # jpg, png or webp
+    "quality": 90,
+}
+
+# Demandware Dynamic Imaging: sw/sh size, sm scale mode, sfrm format, q quality, plus crop/background options
+DEMANDWARE_PARAMS = {"sw", "sh", "sm", "sfrm", "q", "cx", "cy", "cw", "ch", "bgcolor", "strip"}
+# Walmart image service: odnHeight/odnWidth size, odnBg background
+WALMART_PARAMS = {"odnHeight", "odnWidth", "odnBg", "odnDynImageQuality"}
+# Shopify image CDN: width/height/crop/format, v is a cache buster that stays with the asset
+SHOPIFY_PARAMS = {"width", "height", "crop", "format", "pad_color"}
+
+
+def cdn_for(url):
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if "/dw/image/" in parsed.path or "demandware.static" in parsed.path:
+        return "demandware"
+    if host.endswith("walmartimages.com"):
+        return "walmart"
+    if host == "cdn.shopify.com" or parsed.path.startswith("/cdn/shop/"):
+        return "shopify"
+    return None
+
+def _absolute(url):
+    # shopify themes hand out protocol-relative urls and {width} placeholders for lazy loading
+    if url.startswith("//"):
+        url = "https:" + url
+    return url.replace("_{width}x", "").replace("{width}", str(IMAGE_CONFIG["width"]))
+
+def _with_query(parsed, params):
+    return urlunparse(parsed._replace(query=urlencode(params)))
+
+def _strip(url, size_params):
+    parsed = urlparse(url)
+    params = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k not in size_params]
+    return parsed, params
+
+def canonical_url(url):
+    if not url:
+        return url
+    url = _absolute(url)
+    cdn = cdn_for(url)
+    if cdn == "demandware":
+        parsed, params = _strip(url, DEMANDWARE_PARAMS)
+    elif cdn == "walmart":
+        parsed, params = _strip(url, WALMART_PARAMS)
+    elif cdn == "shopify":
+        parsed, params = _strip(url, SHOPIFY_PARAMS)
+    else:
+        return url
+    return _with_query(parsed, sorted(params))
+
+def sized_url(url, config=IMAGE_CONFIG):
+    if not url:
+        return url
+    url = canonical_url(url)
+    cdn = cdn_for(url)
+    parsed = urlparse(url)
+    params = parse_qsl(parsed.query, keep_blank_values=True)
+    if cdn == "demandware":
+        params += [("sw", config["width"]), ("sh", config["height"]), ("sm", "fit"), ("sfrm", config["format"]), ("q", config["quality"])]
+    elif cdn == "walmart":
+        params += [("odnHeight", config["height"]), ("odnWidth", config["width"]), ("odnBg", "FFFFFF")]
+    elif cdn == "shopify":
+        # shopify picks the format from the browser's Accept header, so only the size can be asked for
+        params += [("width", config["width"]), ("height", config["height"])]
+    else:
+        return url
+    return _with_query(parsed, params)
+
+# sized urls with duplicates (the same asset at any size) removed, order preserved
+def normalize_urls(urls, config=IMAGE_CONFIG):
+    seen = set()
+    out = []
+    for url in urls:
+        key = canonical_url(url)
+        if key and key not in seen:
+            seen.add(key)
+            out.append(sized_url(url, config))
+    return out
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from loguru import logger
+import os
+import json
+import threading
+import time
+
+
+# Single-file key -> json value cache with expiry and a size bound.
+# Every entry lives in one json file (instead of one tiny file per key) as {key: {"value", "stored_at"}},
+# in least to most recently used order. Entries older than ttl_hours are dropped when they're read or the
+# file is loaded, the least recently used ones are evicted past max_entries, and new entries are written
+# in batches by replacing the whole file atomically, so a killed run never leaves a half-written cache.
+
+FLUSH_EVERY = 25  # new entries between saves of the cache file
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class KeyedCache:
+    def __init__(self, path, ttl_hours=None, max_entries=None):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600 if ttl_hours is not None else None
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pending = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = OrderedDict(json.load(f))
+            expired = [key for key, entry in self.entries.items() if self._expired(entry)]
+            for key in expired:
+                del self.entries[key]
+            self.pending += len(expired)
+            logger.info(f"Loaded {len(self.entries)} cached entries from {path} ({len(expired)} expired)")
+
+    def _expired(self, entry):
+        return self.ttl_seconds is not None and time.time() - entry["stored_at"] > self.ttl_seconds
+
+    # the cached value, or None if it's missing or expired
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self.entries[key]
+                self.pending += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = {"value": value, "stored_at": time.time()}
+            self.entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            self.pending += 1
+        self.flush()
+
+    def flush(self, force=False):
+        with self.lock:
+            if not force and self.pending < FLUSH_EVERY:
+                return
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.pending = 0
+
+    def close(self):
+        # also saves the recency order of this run's hits
+        self.flush(force=True)
+        logger.info(f"Cache {self.path}: {self.hits} hits, {self.misses} misses, {len(self.entries)} entries")
+
+
+# one cache per file, shared by every thread that reads or writes it
+def for_path(path, ttl_hours=None, max_entries=None):
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = KeyedCache(path, ttl_hours, max_entries)
+        return _caches[path]
@@ -0,0 +1,115 @@
+import functools
+
+from loguru import logger
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        # selectolax < 1.0 only has the modest backend
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+try:
+    import lxml.html
+    import cssselect  # noqa: F401  lxml needs it for css selectors
+except ImportError:
+    lxml = None
+from bs4 import BeautifulSoup
+
+
+# One html parsing layer for every scraper.
+# parse(html) builds the DOM once with the fastest backend installed (selectolax, then lxml, then
+# BeautifulSoup's pure python html.parser) and keeps the last few pages, so the captcha check and the
+# extractors that run after it on the same page share a single parse. Every backend is driven through
+# the same css selector calls:
+#
+#   page = parse(html)
+#   pids = [tile.attr("data-pid") for tile in page.select("div.product")]
+#
+# Checks that only need to know whether something is on the page (has_captcha) look for a marker
+# substring first and skip building a DOM at all when it's missing.
+
+BACKENDS = ("selectolax", "lxml", "bs4")
+PARSED_PAGES = 8  # parsed pages kept for reuse
+
+
+def available_backends():
+    available = []
+    if HTMLParser is not None:
+        available.append("selectolax")
+    if lxml is not None:
+        available.append("lxml")
+    available.append("bs4")
+    return available
+
+DEFAULT_BACKEND = available_backends()[0]
+
+
+class Node:
+    def __init__(self, backend, node):
+        self.backend = backend
+        self.node = node
+
+    def attr(self, name, default=None):
+        if self.backend == "selectolax":
+            value = self.node.attributes.get(name)
+            return default if value is None else value
+        return self.node.get(name, default)
+
+    def text(self):
+        if self.backend == "selectolax":
+            return self.node.text(deep=True)
+        if self.backend == "lxml":
+            return self.node.text_content()
+        return self.node.get_text()
+
+
+class Page:
+    def __init__(self, html, backend=DEFAULT_BACKEND):
+        self.html = html
+        self.backend = backend
+        if backend == "selectolax":
+            self.tree = HTMLParser(html)
+        elif backend == "lxml":
+            self.tree = lxml.html.fromstring(html)
+        else:
+            self.tree = BeautifulSoup(html, "html.parser")
+
+    def select(self, selector):
+        if self.backend == "selectolax":
+            nodes = self.tree.css(selector)
+        elif self.backend == "lxml":
+            nodes = self.tree.cssselect(selector)
+        else:
+            nodes = self.tree.select(selector)
+        return [Node(self.backend, node) for node in nodes]
+
+    def select_one(self, selector):
+        if self.backend == "selectolax":
+            node = self.tree.css_first(selector)
+            return None if node is None else Node(self.backend, node)
+        nodes = self.select(selector)
+        return nodes[0] if nodes else None
+
+
+@functools.lru_cache(maxsize=PARSED_PAGES)
+def _parse(html, backend):
+    return Page(html, backend)
+
+# the parsed page for html, built once and reused by every extractor that asks for the same html
+def parse(html, backend=None):
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", "replace")
+    backend = backend or DEFAULT_BACKEND
+    if backend not in available_backends():
+        logger.warning(f"Parser backend {backend} is not installed, using {DEFAULT_BACKEND}")
+        backend = DEFAULT_BACKEND
+    return _parse(html, backend)
+
+# text of the <pre> chrome wraps json responses in (e.g. Demandware's Product-ShowQuickView)
+def pre_text(html):
+    if "<pre" not in html:
+        return None
+    pre = parse(html).select_one("pre")
+    return None if pre is None else pre.text()
@@ -0,0 +1,104 @@
+from loguru import logger
+import os
+import json
+import threading
+
+
+# Persistent color_id -> raw JSON file index for a raw data folder.
+# Raw files are named <prefix>_<color_id>_<product name>_<color name>_raw.json, so the color id is always
+# the second "_" separated field. The index is built with one os.walk the first time a folder is used,
+# kept up to date as raw files are written and saved next to them as raw_index.json.
+
+INDEX_FILE = "raw_index.json"
+FLUSH_EVERY = 25  # number of new entries between saves of the index file
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def color_id_from_filename(filename):
+    if not filename.endswith("_raw.json"):
+        return None
+    parts = filename.split("_")
+    if len(parts) < 4:
+        return None
+    return parts[1]
+
+
+class RawIndex:
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, INDEX_FILE)
+        self.entries = {}  # color id -> path relative to the raw data folder
+        self.pending = 0
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+            logger.info(f"Loaded raw index with {len(self.entries)} colors from {self.path}")
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        entries = {}
+        for root, _, files in os.walk(self.folder):
+            for file in files:
+                color_id = color_id_from_filename(file)
+                if color_id:
+                    entries[color_id] = os.path.relpath(os.path.join(root, file), self.folder)
+        with self.lock:
+            self.entries = entries
+        self.flush(force=True)
+        logger.info(f"Built raw index with {len(entries)} colors for {self.folder}")
+
+    # returns the path of the raw file for this color id, or None if we haven't scraped it
+    def lookup(self, color_id):
+        with self.lock:
+            relative_path = self.entries.get(color_id)
+        if relative_path is None:
+            return None
+        path = os.path.join(self.folder, relative_path)
+        if not os.path.exists(path):
+            # the file was deleted by hand since the index was written
+            logger.warning(f"Raw index entry for {color_id} points to missing file {path}, dropping it")
+            self.remove(color_id)
+            return None
+        return path
+
+    def load(self, color_id):
+        path = self.lookup(color_id)
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def add(self, color_id, path):
+        with self.lock:
+            self.entries[color_id] = os.path.relpath(path, self.folder)
+            self.pending += 1
+        self.flush()
+
+    def remove(self, color_id):
+        with self.lock:
+            self.entries.pop(color_id, None)
+            self.pending += 1
+        self.flush()
+
+    def flush(self, force=False):
+        with self.lock:
+            if not force and self.pending < FLUSH_EVERY:
+                return
+            os.makedirs(self.folder, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.pending = 0
+
+
+# one index per raw data folder, shared by every thread that reads or writes it
+def for_folder(folder):
+    with _indexes_lock:
+        if folder not in _indexes:
+            _indexes[folder] = RawIndex(folder)
+        return _indexes[folder]
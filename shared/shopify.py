@@ -0,0 +1,69 @@
+import asyncio
+
+from loguru import logger
+
+from shared.http_session import client_from_session, fetch_json
+
+
+# Bulk catalog reads for Shopify storefronts (travelpro.com, awaytravel.com).
+# Every Shopify store serves its collections as plain json, 250 products per page, each product with all of
+# its options, variants and images:
+#
+#   https://<host>/collections/<handle>/products.json?limit=250&page=N
+#
+# so a whole collection is a handful of requests over one pooled http client instead of rendering and
+# scrolling the collection page and loading every variant page in a browser. What the json doesn't have
+# (theme sections like the dimensions tab) still comes from one rendered page per product.
+
+PAGE_LIMIT = 250  # the most products.json returns per page
+COLOR_OPTIONS = ("color", "colour")
+# the storefront json is public, so no browser cookies are needed
+SESSION = {
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "cookies": [],
+}
+
+
+async def fetch_collection_products(client, host, handle, rate_limiter=None):
+    products = []
+    page = 1
+    while True:
+        data = await fetch_json(client, f"https://{host}/collections/{handle}/products.json?limit={PAGE_LIMIT}&page={page}", rate_limiter)
+        products.extend(data["products"])
+        logger.info(f"Page {page} of {host}/collections/{handle}: {len(data['products'])} products")
+        if len(data["products"]) < PAGE_LIMIT:
+            return products
+        page += 1
+
+# every product in a collection, in the storefront's order
+def collection_products(host, handle, rate_limiter=None):
+    async def fetch_all():
+        async with client_from_session(SESSION, referer=f"https://{host}/collections/{handle}") as client:
+            return await fetch_collection_products(client, host, handle, rate_limiter)
+
+    products = asyncio.run(fetch_all())
+    logger.success(f"Fetched {len(products)} products from {host}/collections/{handle}")
+    return products
+
+def product_url(host, product, variant=None):
+    url = f"https://{host}/products/{product['handle']}"
+    return url if variant is None else f"{url}?variant={variant['id']}"
+
+# the variants grouped by their color option value, {"DEFAULT": variants} when the product has no color option
+def color_variants(product):
+    position = None
+    for option in product.get("options", []):
+        if option["name"].strip().lower() in COLOR_OPTIONS:
+            position = option["position"]
+    colors = {}
+    for variant in product["variants"]:
+        color = variant.get(f"option{position}") if position else "DEFAULT"
+        colors.setdefault(color, []).append(variant)
+    return colors
+
+# the image urls for the given variants: their own images, then the shared ones tied to no variant
+def variant_images(product, variants=None):
+    variant_ids = {variant["id"] for variant in variants or []}
+    images = [image for image in product.get("images", []) if variant_ids & set(image.get("variant_ids", []))]
+    images += [image for image in product.get("images", []) if not image.get("variant_ids")]
+    return ["https:" + image["src"] if image["src"].startswith("//") else image["src"] for image in images]